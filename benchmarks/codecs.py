@@ -0,0 +1,80 @@
+"""Bytes and time per teavent message for each codec
+
+    python -m benchmarks.codecs [--participants N] [--iterations N]
+
+`pickle` is what aio_pika RPC used before; the others are `common.codecs`,
+each also with deflate. Times cover encode plus decode into a `Teavent`.
+"""
+
+import argparse
+import pickle
+import time
+from datetime import datetime, timedelta, timezone
+
+from common import codecs
+from common.models import Teavent, TeaventConfig
+
+
+def make_teavent(participants: int) -> Teavent:
+    start = datetime(2024, 7, 31, 21, 0, tzinfo=timezone(timedelta(hours=4)))
+    return Teavent(
+        id="2gud232jsatd8pmnu0mnng0if2",
+        cal_id="1b9c486302b14656cfb10dbdc28240b39054fc6b2c2060928c4c5d0aeccbb4a2@g",
+        summary="Тренировка",
+        description="Тренировка по настольному теннису",
+        location="Arena 2, 2 University St, T'bilisi, Georgia",
+        start=start,
+        end=start + timedelta(hours=2),
+        rrule=["RRULE:FREQ=WEEKLY;WKST=MO;BYDAY=WE,MO,FR"],
+        original_start_time=start,
+        state="poll_open",
+        participant_ids=[f"@participant_{i}" for i in range(participants)],
+        config=TeaventConfig(max=participants + 5, min=3),
+        communication_ids=["-1001234567890"],
+    )
+
+
+def bench_pickle(t: Teavent, iterations: int) -> tuple[int, float]:
+    started = time.perf_counter()
+    for _ in range(iterations):
+        body = pickle.dumps(t)
+        pickle.loads(body)
+    return len(body), (time.perf_counter() - started) / iterations
+
+
+def bench_codec(
+    t: Teavent, codec: codecs.MessageCodec, iterations: int
+) -> tuple[int, float]:
+    started = time.perf_counter()
+    for _ in range(iterations):
+        encoded = codec.encode_model(t)
+        codecs.decode_model(
+            Teavent, encoded.body, encoded.content_type, encoded.content_encoding
+        )
+    return len(encoded.body), (time.perf_counter() - started) / iterations
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--participants", type=int, default=50)
+    parser.add_argument("--iterations", type=int, default=2000)
+    args = parser.parse_args()
+
+    t = make_teavent(args.participants)
+
+    results = [("pickle", *bench_pickle(t, args.iterations))]
+    for content_type in codecs.CODECS:
+        for compress_min in [None, 0]:
+            codec = codecs.MessageCodec(content_type, compress_min=compress_min)
+            name = content_type.split("/")[1] + (
+                "+deflate" if compress_min == 0 else ""
+            )
+            results.append((name, *bench_codec(t, codec, args.iterations)))
+
+    print(f"teavent with {args.participants} participants")
+    for name, size, seconds in results:
+        print(f"{name:>16}: {size:6d} bytes {seconds * 1e6:8.1f} us/message")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""Next-occurrence lookup cost for long-running weekly series
+
+    python -m benchmarks.recurrence [--years N] [--exceptions N] [--iterations N]
+
+`rebuilt` parses the rrule and applies all exdates on every lookup, as
+`Teavent._next_recurrence` did before recurrence sets were cached. `cached`
+is the current lookup: the same instant as `is_last_recurrence` followed by
+`adjust`, then the next week as after a recreate.
+"""
+
+import argparse
+import time
+from datetime import datetime, timedelta
+
+from dateutil.rrule import rruleset, rrulestr
+
+from common.models import Teavent
+from benchmarks.codecs import make_teavent
+
+
+def make_series(years: int, exceptions: int) -> tuple[Teavent, list[Teavent]]:
+    t = make_teavent(participants=10)
+    t.original_start_time = t.original_start_time - timedelta(weeks=52 * years)
+
+    recurring_exceptions = [
+        t.model_copy(
+            update={
+                "id": f"{t.id}_{i}",
+                "rrule": None,
+                "recurring_event_id": t.id,
+                "start": t.start - timedelta(weeks=i + 1),
+                "end": t.end - timedelta(weeks=i + 1),
+            }
+        )
+        for i in range(exceptions)
+    ]
+    return t, recurring_exceptions
+
+
+def rebuilt_next_recurrence(
+    t: Teavent, now: datetime, recurring_exceptions: list[Teavent]
+) -> datetime | None:
+    rr = rruleset()
+    for r in t.rrule:
+        rr.rrule(rrulestr(r, dtstart=t.original_start_time))
+    for e in recurring_exceptions:
+        rr.exdate(datetime.combine(e.start.date(), t.start.time(), tzinfo=t.tz))
+    return rr.after(now)
+
+
+def bench(lookup, t: Teavent, exceptions: list[Teavent], iterations: int) -> float:
+    started = time.perf_counter()
+    for i in range(iterations):
+        now = t.start + timedelta(weeks=i % 4)
+        lookup(t, now, exceptions)
+        lookup(t, now, exceptions)
+    return (time.perf_counter() - started) / (2 * iterations)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--years", type=int, default=5)
+    parser.add_argument("--exceptions", type=int, default=20)
+    parser.add_argument("--iterations", type=int, default=500)
+    args = parser.parse_args()
+
+    t, exceptions = make_series(args.years, args.exceptions)
+    assert rebuilt_next_recurrence(t, t.start, exceptions) == t._next_recurrence(
+        t.start, exceptions
+    )
+
+    rebuilt = bench(rebuilt_next_recurrence, t, exceptions, args.iterations)
+    cached = bench(Teavent._next_recurrence, t, exceptions, args.iterations)
+
+    print(
+        f"weekly series running {args.years} years, "
+        f"{args.exceptions} recurring exceptions"
+    )
+    print(f"{'rebuilt':>8}: {rebuilt * 1e6:10.1f} us/lookup")
+    print(f"{'cached':>8}: {cached * 1e6:10.1f} us/lookup")
+
+
+if __name__ == "__main__":
+    main()
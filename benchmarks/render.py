@@ -0,0 +1,83 @@
+"""Per-update CPU cost of rendering a poll message
+
+    python -m benchmarks.render [--chats N] [--updates N]
+
+`before` renders text and keyboard for every chat with cold formatter caches,
+as the presenter did before; `after` renders once per update and reuses
+cached formatters and keyboards.
+"""
+
+import argparse
+import time
+from datetime import datetime, timedelta, timezone
+
+from common.models import Teavent, TeaventConfig
+from telegrambridge import keyboards, views
+from telegrambridge.views import RegPollView, _fingerprint
+
+_CACHED = [
+    views._location,
+    views._when_inline_in,
+    views._when_in,
+    views._duration,
+    keyboards.make_regpoll_keyboard,
+    keyboards.make_plannedpoll_keyboard,
+    keyboards.make_started_keyboard,
+]
+
+
+def make_teavent(participants: int) -> Teavent:
+    start = datetime(2024, 7, 31, 21, 0, tzinfo=timezone(timedelta(hours=4)))
+    return Teavent(
+        id="2gud232jsatd8pmnu0mnng0if2",
+        cal_id="1b9c486302b14656cfb10dbdc28240b39054fc6b2c2060928c4c5d0aeccbb4a2@g",
+        summary="Тренировка",
+        description="Тренировка по настольному теннису",
+        location="Arena 2, 2 University St, T'bilisi, Georgia",
+        start=start,
+        end=start + timedelta(hours=2),
+        original_start_time=start,
+        communication_ids=["-100123"],
+        state="poll_open",
+        participant_ids=[f"user{i}" for i in range(participants)],
+        config=TeaventConfig(max=participants + 5, min=3),
+    )
+
+
+def before(view: RegPollView, t: Teavent, chats: int):
+    for _ in range(chats):
+        for cached in _CACHED:
+            cached.cache_clear()
+        text_kwargs = view.text(t).as_kwargs()
+        markup = view.keyboard(t)
+        _fingerprint(text_kwargs, markup)
+
+
+def after(view: RegPollView, t: Teavent, chats: int):
+    view.render(t)
+
+
+def bench(fn, view, t, chats, updates) -> float:
+    started = time.perf_counter()
+    for _ in range(updates):
+        fn(view, t, chats)
+    return (time.perf_counter() - started) / updates
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chats", type=int, default=5)
+    parser.add_argument("--updates", type=int, default=1000)
+    parser.add_argument("--participants", type=int, default=10)
+    args = parser.parse_args()
+
+    view = RegPollView()
+    t = make_teavent(args.participants)
+
+    for name, fn in [("before", before), ("after", after)]:
+        per_update = bench(fn, view, t, args.chats, args.updates)
+        print(f"{name:>6}: {per_update * 1e6:8.1f} us/update ({args.chats} chats)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+"""Webhook ingestion throughput against the fake Telegram Bot API
+
+    python -m benchmarks.webhook [--updates N] [--concurrency N] [--duplicates F]
+
+Posts callback query updates to a webhook app whose handler answers the
+callback and edits the message, as poll clicks do. Both bot calls go to
+`telegrambridge.fake_api`. Duplicate updates are dropped by
+`DedupUpdatesMiddleware` backed by an in-memory collection.
+"""
+
+import argparse
+import asyncio
+import random
+import statistics
+import time
+
+import aiogram
+import aiohttp
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+from aiohttp import web
+from pymongo.errors import DuplicateKeyError
+
+from telegrambridge.fake_api import FakeBotAPI
+from telegrambridge.middlewares import DedupUpdatesMiddleware
+
+API_PORT = 18081
+WEBHOOK_PORT = 18080
+TOKEN = "42:fake"
+
+
+class MemoryUpdates:
+    def __init__(self):
+        self._ids = set()
+
+    async def insert_one(self, document: dict):
+        if document["_id"] in self._ids:
+            raise DuplicateKeyError("duplicate update_id")
+        self._ids.add(document["_id"])
+
+
+def make_dispatcher() -> aiogram.Dispatcher:
+    router = aiogram.Router()
+
+    @router.callback_query()
+    async def on_click(callback: aiogram.types.CallbackQuery, bot: aiogram.Bot):
+        await callback.answer()
+        await bot.edit_message_text(
+            "updated", chat_id=callback.message.chat.id, message_id=1
+        )
+
+    dp = aiogram.Dispatcher()
+    dp.include_router(router)
+    dp.update.outer_middleware(DedupUpdatesMiddleware(MemoryUpdates()))
+    return dp
+
+
+def make_update(update_id: int) -> dict:
+    chat = {"id": -100, "type": "supergroup"}
+    user = {"id": update_id, "is_bot": False, "first_name": "user"}
+    return {
+        "update_id": update_id,
+        "callback_query": {
+            "id": str(update_id),
+            "from": user,
+            "chat_instance": "bench",
+            "data": "reg_poll:confirm:teavent",
+            "message": {"message_id": 1, "date": 0, "chat": chat, "text": "poll"},
+        },
+    }
+
+
+async def start(app: web.Application, port: int) -> web.AppRunner:
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, "localhost", port).start()
+    return runner
+
+
+async def bench(updates: int, concurrency: int, duplicates: float):
+    api = FakeBotAPI()
+    api_runner = await start(api.app(), API_PORT)
+
+    bot = aiogram.Bot(
+        TOKEN,
+        session=AiohttpSession(
+            api=TelegramAPIServer.from_base(f"http://localhost:{API_PORT}")
+        ),
+    )
+    dp = make_dispatcher()
+    app = web.Application()
+    SimpleRequestHandler(dispatcher=dp, bot=bot, handle_in_background=False).register(
+        app, path="/webhook"
+    )
+    setup_application(app, dp, bot=bot)
+    webhook_runner = await start(app, WEBHOOK_PORT)
+
+    update_ids = list(range(1, updates + 1))
+    update_ids += random.sample(update_ids, int(updates * duplicates))
+    random.shuffle(update_ids)
+
+    latencies = []
+    semaphore = asyncio.Semaphore(concurrency)
+    url = f"http://localhost:{WEBHOOK_PORT}/webhook"
+
+    async with aiohttp.ClientSession() as client:
+
+        async def post(update_id: int):
+            async with semaphore:
+                started = time.perf_counter()
+                async with client.post(url, json=make_update(update_id)) as response:
+                    response.raise_for_status()
+                latencies.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        await asyncio.gather(*map(post, update_ids))
+        elapsed = time.perf_counter() - started
+
+    await webhook_runner.cleanup()
+    await api_runner.cleanup()
+
+    latencies.sort()
+    print(f"posted {len(update_ids)} updates ({updates} unique) in {elapsed:.2f}s")
+    print(f"  throughput: {len(update_ids) / elapsed:8.1f} updates/s")
+    print(f"  p50:        {statistics.median(latencies) * 1e3:8.2f} ms")
+    print(f"  p99:        {latencies[int(len(latencies) * 0.99)] * 1e3:8.2f} ms")
+    print(f"  bot calls:  {dict(api.calls)}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--updates", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--duplicates", type=float, default=0.1)
+    args = parser.parse_args()
+
+    asyncio.run(bench(args.updates, args.concurrency, args.duplicates))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,257 @@
+"""Message body codecs selected by AMQP `content_type`/`content_encoding`
+
+JSON is always available, msgpack is used if installed. Bodies above
+`compress_min` bytes are deflated. Decoding takes the body bytes as is.
+"""
+
+import time
+import zlib
+from datetime import datetime
+from typing import Any, TypeVar
+
+import aio_pika
+from aio_pika.abc import AbstractIncomingMessage, DeliveryMode
+from aio_pika.patterns import RPC
+from aio_pika.patterns.rpc import RPCMessageType
+import attrs
+from attr import define
+import pydantic
+import pydantic_core
+
+try:
+    import msgpack
+except ImportError:  # optional, JSON is used without it
+    msgpack = None
+
+JSON = "application/json"
+MSGPACK = "application/msgpack"
+DEFLATE = "deflate"
+
+Model = TypeVar("Model", bound=pydantic.BaseModel)
+
+
+class Codec:
+    content_type: str
+
+    def dumps(self, obj: Any) -> bytes:
+        raise NotImplementedError
+
+    def loads(self, data: bytes) -> Any:
+        raise NotImplementedError
+
+    def dump_model(self, model: pydantic.BaseModel) -> bytes:
+        return self.dumps(model.model_dump(mode="json", by_alias=True))
+
+    def load_model(self, cls: type[Model], data: bytes) -> Model:
+        return cls.model_validate(self.loads(data))
+
+
+class JsonCodec(Codec):
+    content_type = JSON
+
+    def dumps(self, obj: Any) -> bytes:
+        return pydantic_core.to_json(obj)
+
+    def loads(self, data: bytes) -> Any:
+        return pydantic_core.from_json(data)
+
+    def dump_model(self, model: pydantic.BaseModel) -> bytes:
+        return model.__pydantic_serializer__.to_json(model, by_alias=True)
+
+    def load_model(self, cls: type[Model], data: bytes) -> Model:
+        # parsed straight from bytes, without a decoded str in between
+        return cls.model_validate_json(data)
+
+
+class MsgpackCodec(Codec):
+    content_type = MSGPACK
+
+    def dumps(self, obj: Any) -> bytes:
+        return msgpack.packb(obj)
+
+    def loads(self, data: bytes) -> Any:
+        return msgpack.unpackb(data)
+
+
+CODECS: dict[str, Codec] = {JSON: JsonCodec()}
+if msgpack is not None:
+    CODECS[MSGPACK] = MsgpackCodec()
+
+# the most compact codec available
+COMPACT = MSGPACK if msgpack is not None else JSON
+
+
+@define(frozen=True)
+class Encoded:
+    body: bytes
+    content_type: str
+    content_encoding: str | None = None
+
+
+@define(frozen=True)
+class MessageCodec:
+    """Codec and compression settings of a publisher"""
+
+    content_type: str = JSON
+    compress_min: int | None = None  # bytes, None disables compression
+
+    @property
+    def codec(self) -> Codec:
+        try:
+            return CODECS[self.content_type]
+        except KeyError:
+            raise ValueError(f"Codec '{self.content_type}' is not available")
+
+    def is_plain(self, content_type: str, size: int) -> bool:
+        """Whether a body of this type and size can be sent as is"""
+        return content_type == self.content_type and not self._compresses(size)
+
+    def encode(self, obj: Any) -> Encoded:
+        return self._compress(self.codec.dumps(obj))
+
+    def encode_model(self, model: pydantic.BaseModel) -> Encoded:
+        return self._compress(self.codec.dump_model(model))
+
+    def _compresses(self, size: int) -> bool:
+        return self.compress_min is not None and size >= self.compress_min
+
+    def _compress(self, body: bytes) -> Encoded:
+        if self._compresses(len(body)):
+            return Encoded(zlib.compress(body), self.content_type, DEFLATE)
+        return Encoded(body, self.content_type)
+
+
+def decode(
+    body: bytes, content_type: str | None = None, content_encoding: str | None = None
+) -> Any:
+    return _codec(content_type).loads(_decompress(body, content_encoding))
+
+
+def decode_model(
+    cls: type[Model],
+    body: bytes,
+    content_type: str | None = None,
+    content_encoding: str | None = None,
+) -> Model:
+    return _codec(content_type).load_model(cls, _decompress(body, content_encoding))
+
+
+def _codec(content_type: str | None) -> Codec:
+    # messages published before codecs have no content_type and are JSON
+    content_type = content_type or JSON
+    try:
+        return CODECS[content_type]
+    except KeyError:
+        raise ValueError(f"Unsupported content type '{content_type}'")
+
+
+def _decompress(body: bytes, content_encoding: str | None) -> bytes:
+    if content_encoding == DEFLATE:
+        return zlib.decompress(body)
+    if content_encoding:
+        raise ValueError(f"Unsupported content encoding '{content_encoding}'")
+    return body
+
+
+# RPC payloads: kwargs and results are trees of plain values and known types
+
+_TYPE = "__type__"
+_TYPES: dict[str, type] = {}
+
+T = TypeVar("T", bound=type)
+
+
+def register(cls: T) -> T:
+    """Allow pydantic models and attrs classes of `cls` in RPC payloads"""
+    _TYPES[cls.__name__] = cls
+    return cls
+
+
+def to_plain(value: Any) -> Any:
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+
+    if isinstance(value, (list, tuple)):
+        return [to_plain(v) for v in value]
+
+    if isinstance(value, dict):
+        return {k: to_plain(v) for k, v in value.items()}
+
+    if isinstance(value, datetime):
+        return {_TYPE: "datetime", "data": value.isoformat()}
+
+    name = type(value).__name__
+    if _TYPES.get(name) is type(value):
+        if isinstance(value, pydantic.BaseModel):
+            data = value.model_dump(mode="json", by_alias=True)
+        else:
+            data = {
+                f.name: to_plain(getattr(value, f.name))
+                for f in attrs.fields(type(value))
+            }
+        return {_TYPE: name, "data": data}
+
+    raise TypeError(f"{name} can not be encoded")
+
+
+def from_plain(value: Any) -> Any:
+    if isinstance(value, list):
+        return [from_plain(v) for v in value]
+
+    if not isinstance(value, dict):
+        return value
+
+    if _TYPE not in value:
+        return {k: from_plain(v) for k, v in value.items()}
+
+    name, data = value[_TYPE], value["data"]
+    if name == "datetime":
+        return datetime.fromisoformat(data)
+
+    cls = _TYPES[name]
+    if issubclass(cls, pydantic.BaseModel):
+        return cls.model_validate(data)
+    return cls(**{k: from_plain(v) for k, v in data.items()})
+
+
+class CodecRPC(RPC):
+    """RPC with payloads encoded by `MessageCodec` instead of pickle
+
+    Payloads must be trees of plain values and registered types; pickled
+    bodies are refused. Exceptions raised by aio_pika itself go back as a
+    plain `{"error": ..., "message": ...}`.
+    """
+
+    message_codec = MessageCodec(COMPACT, compress_min=16 * 1024)
+
+    def serialize_exception(self, exception: Exception) -> dict:
+        return {"error": type(exception).__name__, "message": str(exception)}
+
+    async def serialize_message(
+        self,
+        payload: Any,
+        message_type: RPCMessageType,
+        correlation_id: str | None,
+        delivery_mode: DeliveryMode,
+        **kwargs: Any,
+    ) -> aio_pika.Message:
+        if isinstance(payload, Exception):
+            payload = self.serialize_exception(payload)
+        encoded = self.message_codec.encode(to_plain(payload))
+
+        return aio_pika.Message(
+            encoded.body,
+            content_type=encoded.content_type,
+            content_encoding=encoded.content_encoding,
+            correlation_id=correlation_id,
+            delivery_mode=delivery_mode,
+            timestamp=time.time(),
+            type=message_type.value,
+            **kwargs,
+        )
+
+    async def deserialize_message(self, message: AbstractIncomingMessage) -> Any:
+        # pickle, like any other unknown content type, raises ValueError
+        return from_plain(
+            decode(message.body, message.content_type, message.content_encoding)
+        )
@@ -1,32 +1,196 @@
 import asyncio
+import bisect
+import heapq
 import inspect
 import logging
-from datetime import datetime, timedelta
+import math
+from datetime import datetime, timedelta, timezone
 from abc import ABC, abstractmethod
 from typing import Any
-from collections.abc import Awaitable, Callable
-from collections import defaultdict
+from collections.abc import Awaitable, Callable, Iterable
 
-from attr import define
+from attr import define, field
 
+from common import codecs
 
 log = logging.getLogger(__name__)
 
 
+@codecs.register
+@define(frozen=True)
+class TaskInfo:
+    group_id: str
+    name: str
+    due: datetime | None = None
+
+    def get_name(self) -> str:
+        return f"{self.group_id}:{self.name}"
+
+
+@codecs.register
+@define(frozen=True)
+class TasksPage:
+    total: int
+    offset: int
+    tasks: list[TaskInfo]
+
+
+def _due_key(info: TaskInfo) -> tuple[float, str, str]:
+    ts = info.due.timestamp() if info.due is not None else float("inf")
+    return (ts, info.group_id, info.name)
+
+
 @define
-class Executor(ABC):
-    _tasks: dict[str, dict[str, Any]] = defaultdict(dict)
+class TaskRegistry:
+    """Scheduled tasks indexed by group, name and due time
+
+    Counts are kept incrementally; empty groups are removed right away.
+    """
+
+    _groups: dict[str, dict[str, tuple[Any, TaskInfo]]] = field(factory=dict)
+    _group_ids: list[str] = field(factory=list)  # sorted, for prefix lookups
+    _by_due: list[tuple[float, str, str]] = field(factory=list)  # sorted
+    _by_name: dict[str, set[str]] = field(factory=dict)
+    _count: int = 0
+
+    def __len__(self) -> int:
+        return self._count
 
-    def _add_task(self, task: Any, group_id: str, name: str):
-        if name in self._tasks[group_id]:
+    def count(self, group_id: str) -> int:
+        return len(self._groups.get(group_id, ()))
+
+    def add(self, task: Any, group_id: str, name: str, due: datetime | None = None):
+        group = self._groups.get(group_id)
+        if group is None:
+            group = self._groups[group_id] = {}
+            bisect.insort(self._group_ids, group_id)
+        elif name in group:
             raise RuntimeError(f"task '{name}' already exists in group '{group_id}")
-        self._tasks[group_id][name] = task
+
+        info = TaskInfo(group_id, name, due)
+        group[name] = (task, info)
+        bisect.insort(self._by_due, _due_key(info))
+        self._by_name.setdefault(name, set()).add(group_id)
+        self._count += 1
+
+    def get(self, group_id: str, name: str) -> Any | None:
+        entry = self._groups.get(group_id, {}).get(name)
+        return entry[0] if entry is not None else None
+
+    def pop(self, group_id: str, name: str) -> Any:
+        group = self._groups[group_id]
+        task, info = group.pop(name)
+        self._unindex(info)
+
+        if not group:
+            self._drop_group(group_id)
+
+        return task
+
+    def pop_group(self, group_id: str) -> dict[str, Any]:
+        group = self._groups[group_id]
+        for _, info in group.values():
+            self._unindex(info)
+        self._drop_group(group_id)
+
+        return {name: task for name, (task, _) in group.items()}
+
+    def clear(self):
+        self._groups.clear()
+        self._group_ids.clear()
+        self._by_due.clear()
+        self._by_name.clear()
+        self._count = 0
+
+    def tasks(self) -> list[Any]:
+        return [task for group in self._groups.values() for task, _ in group.values()]
+
+    def query(
+        self,
+        group_prefix: str = None,
+        name: str = None,
+        due_from: datetime = None,
+        due_to: datetime = None,
+        offset: int = 0,
+        limit: int = None,
+    ) -> TasksPage:
+        """Tasks ordered by due time, starting from the most selective index"""
+        if group_prefix is None and name is None:
+            lo, hi = self._due_range(due_from, due_to)
+            stop = hi if limit is None else min(hi, lo + offset + limit)
+            infos = [
+                self._groups[group_id][n][1]
+                for _, group_id, n in self._by_due[lo + offset : stop]
+            ]
+            return TasksPage(total=hi - lo, offset=offset, tasks=infos)
+
+        if group_prefix is not None:
+            group_ids = self._prefixed(group_prefix)
+        else:
+            group_ids = self._by_name.get(name, ())
+
+        lo_key = due_from.timestamp() if due_from is not None else float("-inf")
+        hi_key = due_to.timestamp() if due_to is not None else float("inf")
+
+        matched = sorted(
+            (
+                info
+                for group_id in group_ids
+                for _, info in self._groups[group_id].values()
+                if (name is None or info.name == name)
+                and lo_key <= _due_key(info)[0] <= hi_key
+            ),
+            key=_due_key,
+        )
+        stop = None if limit is None else offset + limit
+        return TasksPage(total=len(matched), offset=offset, tasks=matched[offset:stop])
+
+    def _due_range(self, due_from: datetime | None, due_to: datetime | None):
+        lo = 0
+        if due_from is not None:
+            lo = bisect.bisect_left(self._by_due, (due_from.timestamp(),))
+        hi = len(self._by_due)
+        if due_to is not None:
+            hi = bisect.bisect_left(
+                self._by_due, (math.nextafter(due_to.timestamp(), math.inf),)
+            )
+        return lo, max(lo, hi)
+
+    def _prefixed(self, prefix: str) -> Iterable[str]:
+        start = bisect.bisect_left(self._group_ids, prefix)
+        for group_id in self._group_ids[start:]:
+            if not group_id.startswith(prefix):
+                break
+            yield group_id
+
+    def _unindex(self, info: TaskInfo):
+        key = _due_key(info)
+        del self._by_due[bisect.bisect_left(self._by_due, key)]
+
+        group_ids = self._by_name[info.name]
+        group_ids.discard(info.group_id)
+        if not group_ids:
+            del self._by_name[info.name]
+
+        self._count -= 1
+
+    def _drop_group(self, group_id: str):
+        del self._groups[group_id]
+        del self._group_ids[bisect.bisect_left(self._group_ids, group_id)]
+
+
+@define
+class Executor(ABC):
+    _tasks: TaskRegistry = field(factory=TaskRegistry)
+
+    def _add_task(self, task: Any, group_id: str, name: str, due: datetime = None):
+        self._tasks.add(task, group_id, name, due)
 
     def _pop_group(self, group_id: str) -> dict[str, Any]:
-        return self._tasks.pop(group_id)
+        return self._tasks.pop_group(group_id)
 
     def _pop_task(self, group_id: str, name: str) -> Any:
-        return self._tasks[group_id].pop(name)
+        return self._tasks.pop(group_id, name)
 
     @abstractmethod
     def schedule(self, fn, group_id: str, name: str = None, delay_seconds: int = 0): ...
@@ -38,7 +202,10 @@ class Executor(ABC):
     def now(self, tz=None) -> datetime: ...
 
     def tasks(self) -> list[Any]:
-        return sum((list(group.values()) for group in self._tasks.values()), [])
+        return self._tasks.tasks()
+
+    def query_tasks(self, **kwargs) -> TasksPage:
+        return self._tasks.query(**kwargs)
 
 
 async def _task(fn: Awaitable | Callable, name: str, delay_seconds: int):
@@ -80,7 +247,8 @@ class AsyncioExecutor(Executor):
 
         asynciotask.add_done_callback(_on_task_done)
 
-        self._add_task(asynciotask, group_id, name)
+        due = self.now(timezone.utc) + timedelta(seconds=delay_seconds)
+        self._add_task(asynciotask, group_id, name, due)
 
     def cancel(self, group_id: str):
         for task in self._pop_group(group_id).values():
@@ -88,3 +256,126 @@ class AsyncioExecutor(Executor):
 
     def now(self, tz=None) -> datetime:
         return datetime.now(tz)
+
+
+@define(eq=False)
+class _Timer:
+    fn: Awaitable | Callable
+    group_id: str
+    name: str
+    deadline: float
+
+    task: asyncio.Task | None = None
+    cancelled: bool = False
+
+    def get_name(self) -> str:
+        return f"{self.group_id}:{self.name}"
+
+    def cancel(self):
+        self.cancelled = True
+
+        if self.task is not None:
+            self.task.cancel()
+        elif inspect.iscoroutine(self.fn):
+            # never started, close it to avoid "coroutine was never awaited"
+            self.fn.close()
+
+
+@define
+class HeapExecutor(Executor):
+    """Keeps all deadlines in a single heap, driven by one loop timer
+
+    Unlike AsyncioExecutor there is no parked asyncio.Task per scheduled action:
+    awaitables are wrapped into a task only when their deadline is reached.
+    Cancelled timers are removed from the heap lazily.
+    """
+
+    _heap: list[tuple[float, int, _Timer]] = field(factory=list)
+    _seq: int = 0
+    _num_cancelled: int = 0
+    _handle: asyncio.TimerHandle | None = None
+
+    def schedule(
+        self,
+        fn: Awaitable | Callable,
+        group_id: str,
+        name: str = None,
+        delay_seconds: int = 0,
+    ):
+        if delay_seconds < 0:
+            log.warning(f"Negative delay for task {name}")
+
+        name = name or id(fn)
+
+        loop = asyncio.get_running_loop()
+        timer = _Timer(fn, group_id, name, deadline=loop.time() + max(delay_seconds, 0))
+
+        at = datetime.now() + timedelta(seconds=delay_seconds)
+        log.info(
+            f"Schedule '{timer.get_name()}' to run in {delay_seconds} seconds (at {at} UTC)"
+        )
+
+        due = self.now(timezone.utc) + timedelta(seconds=max(delay_seconds, 0))
+        self._add_task(timer, group_id, name, due)
+
+        self._seq += 1
+        heapq.heappush(self._heap, (timer.deadline, self._seq, timer))
+
+        if self._heap[0][2] is timer:
+            self._arm(loop)
+
+    def cancel(self, group_id: str):
+        for timer in self._pop_group(group_id).values():
+            if timer.task is None:
+                self._num_cancelled += 1
+            timer.cancel()
+
+        if self._num_cancelled > len(self._heap) // 2:
+            self._compact()
+
+    def now(self, tz=None) -> datetime:
+        return datetime.now(tz)
+
+    def _arm(self, loop: asyncio.AbstractEventLoop):
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+
+        if self._heap:
+            self._handle = loop.call_at(self._heap[0][0], self._fire, loop)
+
+    def _compact(self):
+        self._heap = [entry for entry in self._heap if not entry[2].cancelled]
+        heapq.heapify(self._heap)
+        self._num_cancelled = 0
+
+    def _fire(self, loop: asyncio.AbstractEventLoop):
+        self._handle = None
+        now = loop.time()
+
+        while self._heap and self._heap[0][0] <= now:
+            _, _, timer = heapq.heappop(self._heap)
+            if timer.cancelled:
+                self._num_cancelled -= 1
+                continue
+
+            self._run(timer)
+
+        self._arm(loop)
+
+    def _run(self, timer: _Timer):
+        if inspect.isawaitable(timer.fn):
+            timer.task = asyncio.ensure_future(timer.fn)
+            timer.task.add_done_callback(lambda _: self._discard(timer))
+            return
+
+        # trigger may reschedule a task with the same name
+        self._discard(timer)
+        try:
+            timer.fn()
+        except Exception:
+            log.exception(f"Task '{timer.get_name()}' failed")
+
+    def _discard(self, timer: _Timer):
+        if self._tasks.get(timer.group_id, timer.name) is timer:
+            self._pop_task(timer.group_id, timer.name)
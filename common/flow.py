@@ -22,6 +22,7 @@ class TeaventFlow(StateMachine):
     start_poll = created.to(poll_open)
     confirm = created.to.itself(internal=True, cond="forced") | poll_open.to.itself(internal=True) | planned.to.itself(internal=True)
     reject = created.to.itself(internal=True) | poll_open.to.itself(internal=True) | planned.to.itself(internal=True, validators="has_reserve") 
+    change_participants = created.to.itself(internal=True, cond="forced_if_adding") | poll_open.to.itself(internal=True) | planned.to.itself(internal=True)
     stop_poll = poll_open.to(planned, cond="ready") | poll_open.to(cancelled, unless="ready")
     cancel = cancelled.from_(created, poll_open, planned)
     start_ = planned.to(started)
@@ -40,6 +41,10 @@ class TeaventFlow(StateMachine):
     def forced(self, force: bool) -> bool:
         return force
 
+    def forced_if_adding(self, add: list[str], force: bool) -> bool:
+        # as `confirm` and `reject` one by one
+        return force or not add
+
     def has_reserve(self, model: Teavent, force: bool):
         if force:
             return
@@ -85,6 +90,34 @@ class TeaventFlow(StateMachine):
     def remove_participant(self, user_id: str, model: Teavent):
         model.participant_ids.remove(user_id)
 
+    @change_participants.validators
+    def valid_participants_change(
+        self, add: list[str], remove: list[str], force: bool, model: Teavent
+    ):
+        # the whole change is checked before any participant is touched
+        if len(set(add)) < len(add):
+            raise RuntimeError("Participants to add are repeated")
+
+        for user_id in add:
+            if model.confirmed_by(user_id):
+                raise RuntimeError(f"'{user_id}' has already confirmed")
+
+        for user_id in remove:
+            if not model.confirmed_by(user_id):
+                raise RuntimeError(f"it is not confirmed by '{user_id}'")
+
+        if self.current_state == self.planned and not force:
+            if len(set(remove)) > len(model.reserve_participant_ids):
+                raise RuntimeError("No reserve")
+
+    @change_participants.on
+    def change_participant_ids(self, add: list[str], remove: list[str], model: Teavent):
+        removed = set(remove)
+        model.participant_ids = [
+            *(p for p in model.participant_ids if p not in removed),
+            *add,
+        ]
+
     @recreate.validators
     def is_recurring(self, model: Teavent):
         if not model.is_reccurring:
@@ -1,12 +1,17 @@
 from base64 import b64encode
-from datetime import time, datetime, timedelta, date, timezone
+from datetime import time, datetime, timedelta, date, timezone, tzinfo
+from functools import lru_cache
 import logging
+from typing import Literal
 
+from attr import define
 from dateutil.rrule import rruleset, rrulestr
 import yaml
 import pydantic
 from pydantic import Field
+import pydantic_core
 
+from common import codecs
 from common.errors import EventDescriptionParsingError
 from common.pika_pydantic import TeaveModel
 
@@ -53,6 +58,83 @@ class TeaventConfig(pydantic.BaseModel):
         return TeaventConfig()
 
 
+@define(frozen=True)
+class TeaventSnapshot:
+    """Teavent serialised once per version and shared by all consumers
+
+    `document` is the by-alias JSON-compatible dump and must not be mutated,
+    `body` is the same document encoded as JSON.
+    """
+
+    id: str
+    version: int
+    state: str
+    document: dict
+    body: bytes
+
+    @staticmethod
+    def of(teavent: "Teavent") -> "TeaventSnapshot":
+        document = teavent.model_dump(mode="json", by_alias=True)
+        return TeaventSnapshot(
+            id=teavent.id,
+            version=teavent.version,
+            state=teavent.state,
+            document=document,
+            body=pydantic_core.to_json(document),
+        )
+
+
+# rrule, original start time and its zone
+_RecurrenceKey = tuple[tuple[str, ...], datetime, tzinfo | None]
+
+
+@lru_cache(maxsize=256)
+def _compile_rrules(
+    rrule: tuple[str, ...], dtstart: datetime, tz: tzinfo | None
+) -> tuple:
+    # shared by all copies of a series, dateutil memoises occurrences as iterated;
+    # `tz` is a part of the key: the same instant in another zone is an equal
+    # datetime, but has other local dates and weekdays
+    return tuple(rrulestr(r, dtstart=dtstart, cache=True) for r in rrule)
+
+
+@define
+class _Recurrence:
+    """Compiled recurrence set of a teavent with exdates of its exceptions"""
+
+    key: _RecurrenceKey
+    rruleset: rruleset
+    exdates: frozenset[datetime] = frozenset()
+    # the last lookup, repeated by is_last_recurrence and adjust on recreate
+    last: tuple[datetime, datetime | None] | None = None
+
+    @staticmethod
+    def compile(key: _RecurrenceKey) -> "_Recurrence":
+        rr = rruleset(cache=True)
+        for r in _compile_rrules(*key):
+            rr.rrule(r)
+        return _Recurrence(key, rr)
+
+    def exclude(self, exdates: frozenset[datetime]) -> bool:
+        """Add new exdates; False if some are gone and the set must be rebuilt"""
+        if not self.exdates <= exdates:
+            return False
+
+        if exdates != self.exdates:
+            for exdate in exdates - self.exdates:
+                self.rruleset.exdate(exdate)
+            self.exdates = exdates
+            self.last = None
+
+        return True
+
+    def after(self, now: datetime) -> datetime | None:
+        if self.last is None or self.last[0] != now:
+            self.last = (now, self.rruleset.after(now))
+        return self.last[1]
+
+
+@codecs.register
 class Teavent(TeaveModel):
     id: str = Field(alias="_id")
     cal_id: str
@@ -77,8 +159,14 @@ class Teavent(TeaveModel):
 
     communication_ids: list[str]
 
+    # bumped by eventmanager on every transition, lets consumers drop stale copies
+    version: int = 0
+
     model_config = {"extra": "forbid", "populate_by_name": True}
 
+    _snapshot: TeaventSnapshot | None = pydantic.PrivateAttr(default=None)
+    _recurrence: _Recurrence | None = pydantic.PrivateAttr(default=None)
+
     @staticmethod
     def from_gcal_event(gcal_event_item: dict[str, str]) -> "Teavent":
         _ = gcal_event_item
@@ -107,6 +195,12 @@ class Teavent(TeaveModel):
             communication_ids=[],
         )
 
+    def snapshot(self) -> TeaventSnapshot:
+        """Snapshot of the current version, built on first use"""
+        if self._snapshot is None or self._snapshot.version != self.version:
+            self._snapshot = TeaventSnapshot.of(self)
+        return self._snapshot
+
     @property
     def effective_max(self) -> int:
         return self.effective_max_ or self.config.max
@@ -124,8 +218,7 @@ class Teavent(TeaveModel):
             # TODO: check non-recurring events
             eid = f"{self.id} {self.cal_id}"
 
-        b64eid = b64encode(eid.encode()).rstrip(b"=").decode()
-        return f"https://www.google.com/calendar/event?eid={b64eid}"
+        return _gcal_event_link(eid)
 
     @property
     def num_participants(self) -> int:
@@ -180,12 +273,6 @@ class Teavent(TeaveModel):
                 second=t.second,
             )
 
-    def _rruleset(self) -> rruleset:
-        rr = rruleset()
-        for r in self.rrule:
-            rr.rrule(rrulestr(r, dtstart=self.original_start_time))
-        return rr
-
     def is_last_recurrence(
         self, now: datetime, recurring_exceptions: list["Teavent"]
     ) -> bool:
@@ -201,15 +288,34 @@ class Teavent(TeaveModel):
     def _next_recurrence(
         self, now: datetime, recurring_exceptions: list["Teavent"]
     ) -> datetime | None:
-        rr = self._rruleset()
+        exdates = []
         for t in recurring_exceptions:
             assert t.rrule is None
             assert t.recurring_event_id is not None
             assert t.recurring_event_id == self.id
             exdate = datetime.combine(t.start.date(), self.start.time(), tzinfo=self.tz)
-            rr.exdate(exdate)
+            exdates.append(exdate)
+
+        return self._recurrence_set(frozenset(exdates)).after(now)
+
+    def _recurrence_set(self, exdates: frozenset[datetime]) -> _Recurrence:
+        """Cached recurrence set, rebuilt when rrule changes or exdates are gone"""
+        key = (
+            tuple(self.rrule),
+            self.original_start_time,
+            self.original_start_time.tzinfo,
+        )
 
-        return rr.after(now)
+        recurrence = self._recurrence
+        if (
+            recurrence is None
+            or recurrence.key != key
+            or not recurrence.exclude(exdates)
+        ):
+            recurrence = self._recurrence = _Recurrence.compile(key)
+            recurrence.exclude(exdates)
+
+        return recurrence
 
     def shift_to(self, new_date: date):
         duration = self.duration
@@ -231,5 +337,26 @@ class Teavent(TeaveModel):
         return self.participant_ids[self.effective_max :]
 
 
+@codecs.register
+class TeaventsPage(TeaveModel):
+    teavents: list[Teavent]
+    next_cursor: str | None = None
+
+
+@codecs.register
+class ImportResult(TeaveModel):
+    """Outcome of one teavent of a bulk import"""
+
+    id: str
+    status: Literal["managed", "updated", "skipped", "failed"]
+    error: str | None = None
+
+
+@lru_cache(maxsize=1024)
+def _gcal_event_link(eid: str) -> str:
+    b64eid = b64encode(eid.encode()).rstrip(b"=").decode()
+    return f"https://www.google.com/calendar/event?eid={b64eid}"
+
+
 def _calid_from_email(email: str) -> str:
     return email.split("@")[0] + "@g"
@@ -4,11 +4,20 @@ import aio_pika
 from aio_pika.abc import AbstractIncomingMessage
 import pydantic
 
+from common import codecs
+
 
 class ModelMessage(aio_pika.Message):
-    def __init__(self, model: pydantic.BaseModel):
+    def __init__(
+        self,
+        model: pydantic.BaseModel,
+        codec: codecs.MessageCodec = codecs.MessageCodec(),
+    ):
+        encoded = codec.encode_model(model)
         super().__init__(
-            model.model_dump_json(by_alias=True).encode(),
+            encoded.body,
+            content_type=encoded.content_type,
+            content_encoding=encoded.content_encoding,
             delivery_mode=aio_pika.DeliveryMode.PERSISTENT,
         )
 
@@ -21,7 +30,9 @@ class TeaveModel(pydantic.BaseModel):
 
     @classmethod
     def from_message(cls: type[Model], message: AbstractIncomingMessage) -> Model:
-        model = cls.model_validate_json(message.body.decode())
+        model = codecs.decode_model(
+            cls, message.body, message.content_type, message.content_encoding
+        )
         model._delivery_tag = message.delivery_tag
         return model
 
@@ -0,0 +1,279 @@
+"""Typed RPC between telegrambridge and eventmanager
+
+Each method is a pydantic request model. A handler result goes back in a
+`Reply` carrying either the result or an `ErrorInfo` with a code mapped from
+`common.errors`, so exceptions never cross the wire. A batch executes many
+requests in one round-trip, each with its own reply.
+"""
+
+import asyncio
+import enum
+import logging
+import math
+from collections.abc import Awaitable, Callable, Iterable
+from datetime import datetime
+from functools import partial
+from typing import Any, ClassVar, Literal
+
+from aio_pika.patterns import RPC
+from attr import define, field
+import pydantic
+from statemachine.exceptions import TransitionNotAllowed
+
+from common import codecs
+from common.errors import (
+    BadTeavent,
+    EventDescriptionParsingError,
+    TeaveError,
+    TeaventFromThePast,
+    TeaventIsInFinalState,
+    TeaventIsManaged,
+    UnknownTeavent,
+)
+from common.models import Teavent
+
+log = logging.getLogger(__name__)
+
+BATCH = "batch"
+DEFAULT_TIMEOUT = 10.0  # seconds
+MAX_PAGE_SIZE = 100
+
+
+class ErrorCode(enum.StrEnum):
+    UNKNOWN_TEAVENT = "unknown_teavent"
+    FINAL_STATE = "final_state"
+    FROM_THE_PAST = "from_the_past"
+    IS_MANAGED = "is_managed"
+    BAD_TEAVENT = "bad_teavent"
+    BAD_DESCRIPTION = "bad_description"
+    NOT_ALLOWED = "not_allowed"  # no such transition from the current state
+    REJECTED = "rejected"  # refused by a flow validator
+    INVALID_REQUEST = "invalid_request"
+    TIMEOUT = "timeout"
+    INTERNAL = "internal"
+
+
+# most specific classes first
+_ERROR_CODES: list[tuple[type[Exception], ErrorCode]] = [
+    (UnknownTeavent, ErrorCode.UNKNOWN_TEAVENT),
+    (TeaventIsInFinalState, ErrorCode.FINAL_STATE),
+    (TeaventFromThePast, ErrorCode.FROM_THE_PAST),
+    (TeaventIsManaged, ErrorCode.IS_MANAGED),
+    (BadTeavent, ErrorCode.BAD_TEAVENT),
+    (EventDescriptionParsingError, ErrorCode.BAD_DESCRIPTION),
+    (TransitionNotAllowed, ErrorCode.NOT_ALLOWED),
+    (pydantic.ValidationError, ErrorCode.INVALID_REQUEST),
+    # flow validators refuse actions with RuntimeError
+    (RuntimeError, ErrorCode.REJECTED),
+]
+
+
+def error_code(e: Exception) -> ErrorCode:
+    for cls, code in _ERROR_CODES:
+        if isinstance(e, cls):
+            return code
+    return ErrorCode.INTERNAL
+
+
+class RpcError(TeaveError):
+    def __init__(self, code: ErrorCode, message: str):
+        self.code = code
+        super().__init__(message)
+
+
+@codecs.register
+@define(frozen=True)
+class ErrorInfo:
+    code: ErrorCode = field(converter=ErrorCode)
+    message: str
+
+    @staticmethod
+    def of(e: Exception) -> "ErrorInfo":
+        return ErrorInfo(error_code(e), str(e))
+
+
+@codecs.register
+@define(frozen=True)
+class Reply:
+    result: Any = None
+    error: ErrorInfo | None = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+    def unwrap(self) -> Any:
+        if self.error is not None:
+            raise RpcError(self.error.code, self.error.message)
+        return self.result
+
+
+# requests
+
+
+class Request(pydantic.BaseModel):
+    method: ClassVar[str]
+
+
+@codecs.register
+class GetTeavent(Request):
+    method: ClassVar[str] = "get_teavent"
+
+    id: str
+
+
+@codecs.register
+class QueryTeavents(Request):
+    method: ClassVar[str] = "query_teavents"
+
+    cal_id: str | None = None
+    chat_id: str | None = None
+    state: str | None = None
+    start_from: datetime | None = None
+    start_to: datetime | None = None
+    cursor: str | None = None
+    limit: int = pydantic.Field(20, ge=1, le=MAX_PAGE_SIZE)
+
+
+@codecs.register
+class ManageTeavent(Request):
+    method: ClassVar[str] = "manage_teavent"
+
+    teavent: Teavent
+
+
+@codecs.register
+class ManageTeavents(Request):
+    """Calendar import, replies with a list of `ImportResult`"""
+
+    method: ClassVar[str] = "manage_teavents"
+
+    teavents: list[Teavent]
+    upsert: bool = False
+
+
+@codecs.register
+class UserAction(Request):
+    method: ClassVar[str] = "user_action"
+
+    type: str
+    user_id: str
+    teavent_id: str
+    force: bool = False
+
+
+@codecs.register
+class UserActions(Request):
+    """Same action of many users, applied as a single transition"""
+
+    method: ClassVar[str] = "user_actions"
+
+    type: Literal["confirm", "reject"]
+    user_ids: list[str]
+    teavent_id: str
+    force: bool = False
+
+
+@codecs.register
+class Tasks(Request):
+    method: ClassVar[str] = "tasks"
+
+    group_prefix: str | None = None
+    name: str | None = None
+    due_from: datetime | None = None
+    due_to: datetime | None = None
+    offset: int = pydantic.Field(0, ge=0)
+    limit: int = pydantic.Field(20, ge=1, le=MAX_PAGE_SIZE)
+
+
+@codecs.register
+class PublishStats(Request):
+    method: ClassVar[str] = "publish_stats"
+
+
+@define(eq=False)
+class RpcServer:
+    """Registers handlers of request models as RPC methods"""
+
+    _rpc: RPC
+    _handlers: dict[str, tuple[type[Request], Callable[[Request], Any]]] = field(
+        factory=dict
+    )
+
+    def handler(self, cls: type[Request]):
+        def decorate(func: Callable[[Request], Any]):
+            self._handlers[cls.method] = (cls, func)
+            return func
+
+        return decorate
+
+    def execute(self, request: Request, method: str | None = None) -> Reply:
+        handler = self._handlers.get(method or getattr(request, "method", None))
+        if handler is None or not isinstance(request, handler[0]):
+            return Reply(
+                error=ErrorInfo(
+                    ErrorCode.INVALID_REQUEST,
+                    f"Unexpected request {type(request).__name__}",
+                )
+            )
+
+        try:
+            return Reply(result=handler[1](request))
+        except Exception as e:
+            info = ErrorInfo.of(e)
+            if info.code == ErrorCode.INTERNAL:
+                log.exception(f"Failed to execute {type(request).__name__}")
+            return Reply(error=info)
+
+    def execute_batch(self, requests: Iterable[Request]) -> list[Reply]:
+        """Requests are executed in order, a failed one does not stop the rest"""
+        return [self.execute(request) for request in requests]
+
+    async def register(self):
+        for method in self._handlers:
+            call = partial(self._call, method)
+            await self._rpc.register(method, call, auto_delete=True)
+        await self._rpc.register(BATCH, self._batch, auto_delete=True)
+
+    def _call(self, method: str, *, request: Request) -> Reply:
+        return self.execute(request, method)
+
+    def _batch(self, *, requests: list[Request]) -> list[Reply]:
+        return self.execute_batch(requests)
+
+
+@define(eq=False)
+class RpcClient:
+    _rpc: RPC
+    timeout: float = DEFAULT_TIMEOUT
+
+    async def call(self, request: Request, timeout: float | None = None) -> Any:
+        reply: Reply = await self._send(request.method, {"request": request}, timeout)
+        return reply.unwrap()
+
+    async def batch(
+        self, requests: Iterable[Request], timeout: float | None = None
+    ) -> list[Reply]:
+        requests = list(requests)
+        if not requests:
+            return []
+        return await self._send(BATCH, {"requests": requests}, timeout)
+
+    def proxy(self, cls: type[Request]) -> Callable[..., Awaitable]:
+        """Coroutine function taking fields of `cls` as kwargs"""
+
+        async def call(timeout: float | None = None, **kwargs):
+            return await self.call(cls(**kwargs), timeout=timeout)
+
+        return call
+
+    async def _send(self, method: str, kwargs: dict, timeout: float | None) -> Any:
+        timeout = timeout or self.timeout
+        try:
+            return await asyncio.wait_for(
+                # expired requests are dropped by the broker, never executed late
+                self._rpc.call(method, kwargs, expiration=math.ceil(timeout)),
+                timeout,
+            )
+        except TimeoutError:
+            raise RpcError(ErrorCode.TIMEOUT, f"'{method}' timed out after {timeout}s")
@@ -0,0 +1,75 @@
+from datetime import datetime, timezone
+import pickle
+
+import aio_pika
+from aio_pika.abc import DeliveryMode
+from aio_pika.patterns.rpc import RPCMessageType
+import pytest
+
+from common import codecs
+from common.executors import TaskInfo, TasksPage
+from common.models import Teavent
+
+
+def _roundtrip(codec: codecs.MessageCodec, value):
+    encoded = codec.encode(codecs.to_plain(value))
+    plain = codecs.decode(encoded.body, encoded.content_type, encoded.content_encoding)
+    return codecs.from_plain(plain)
+
+
+@pytest.mark.parametrize("content_type", list(codecs.CODECS))
+@pytest.mark.parametrize("compress_min", [None, 0])
+def test_rpc_payload_roundtrip(content_type, compress_min, teavent: Teavent):
+    codec = codecs.MessageCodec(content_type, compress_min=compress_min)
+    due = datetime(2024, 8, 1, tzinfo=timezone.utc)
+    page = TasksPage(total=1, offset=0, tasks=[TaskInfo("g", "start_poll", due)])
+
+    assert _roundtrip(codec, {"teavent": teavent, "due": due}) == {
+        "teavent": teavent,
+        "due": due,
+    }
+    assert _roundtrip(codec, page) == page
+
+
+def test_unknown_types_are_not_encoded():
+    with pytest.raises(TypeError):
+        codecs.to_plain(RuntimeError("boom"))
+
+
+def test_compressed_model(teavent: Teavent):
+    teavent.participant_ids = [f"@user{i}" for i in range(100)]
+    encoded = codecs.MessageCodec(compress_min=1024).encode_model(teavent)
+
+    assert encoded.content_encoding == codecs.DEFLATE
+    assert (
+        codecs.decode_model(
+            Teavent, encoded.body, encoded.content_type, encoded.content_encoding
+        )
+        == teavent
+    )
+
+
+async def test_rpc_refuses_pickle():
+    rpc = codecs.CodecRPC(channel=None)
+
+    with pytest.raises(TypeError):
+        await rpc.serialize_message(
+            object(), RPCMessageType.RESULT, "1", DeliveryMode.NOT_PERSISTENT
+        )
+
+    pickled = aio_pika.Message(pickle.dumps({"id": "1"}), content_type=rpc.CONTENT_TYPE)
+    with pytest.raises(ValueError):
+        await rpc.deserialize_message(pickled)
+
+
+async def test_rpc_exceptions_are_plain():
+    rpc = codecs.CodecRPC(channel=None)
+
+    message = await rpc.serialize_message(
+        KeyError("nope"), RPCMessageType.ERROR, "1", DeliveryMode.NOT_PERSISTENT
+    )
+
+    assert await rpc.deserialize_message(message) == {
+        "error": "KeyError",
+        "message": "'nope'",
+    }
@@ -0,0 +1,127 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from common.executors import HeapExecutor, TaskRegistry
+
+
+@pytest.fixture
+def executor():
+    return HeapExecutor()
+
+
+async def test_runs_in_deadline_order(executor: HeapExecutor):
+    fired = []
+
+    executor.schedule(
+        lambda: fired.append("b"), group_id="g1", name="b", delay_seconds=0.02
+    )
+    executor.schedule(
+        lambda: fired.append("a"), group_id="g2", name="a", delay_seconds=0.01
+    )
+    executor.schedule(
+        lambda: fired.append("c"), group_id="g1", name="c", delay_seconds=0.03
+    )
+
+    await asyncio.sleep(0.05)
+
+    assert fired == ["a", "b", "c"]
+    assert executor.tasks() == []
+
+
+async def test_cancel_group(executor: HeapExecutor):
+    fired = []
+
+    executor.schedule(
+        lambda: fired.append("a"), group_id="g1", name="a", delay_seconds=0.01
+    )
+    executor.schedule(
+        lambda: fired.append("b"), group_id="g2", name="b", delay_seconds=0.01
+    )
+    executor.cancel("g1")
+
+    await asyncio.sleep(0.02)
+
+    assert fired == ["b"]
+
+    with pytest.raises(KeyError):
+        executor.cancel("g1")
+
+
+async def test_awaitable_is_tracked_until_done(executor: HeapExecutor):
+    done = asyncio.Event()
+
+    async def job():
+        await done.wait()
+
+    executor.schedule(job(), group_id="g", name="job")
+    await asyncio.sleep(0)
+    await asyncio.sleep(0)
+
+    assert [t.get_name() for t in executor.tasks()] == ["g:job"]
+
+    done.set()
+    await asyncio.sleep(0)
+    await asyncio.sleep(0)
+
+    assert executor.tasks() == []
+
+
+async def test_cancel_not_started_awaitable(executor: HeapExecutor):
+    async def job():
+        raise AssertionError("must not run")
+
+    executor.schedule(job(), group_id="g", name="job", delay_seconds=0.01)
+    executor.cancel("g")
+
+    await asyncio.sleep(0.02)
+
+
+@pytest.fixture
+def registry():
+    registry = TaskRegistry()
+    base = datetime(2024, 8, 1, tzinfo=timezone.utc)
+
+    for i, (group_id, name) in enumerate(
+        [
+            ("a_sm", "start_poll"),
+            ("b_sm", "stop_poll"),
+            ("b_pub", "planned_1"),
+            ("c_sm", "start_poll"),
+        ]
+    ):
+        registry.add(object(), group_id, name, due=base + timedelta(hours=i))
+
+    return registry
+
+
+def test_registry_counts(registry: TaskRegistry):
+    assert len(registry) == 4
+    assert registry.count("b_sm") == 1
+
+    registry.pop_group("b_sm")
+    assert len(registry) == 3
+    assert registry.count("b_sm") == 0
+
+    with pytest.raises(KeyError):
+        registry.pop_group("b_sm")
+
+
+def test_registry_query(registry: TaskRegistry):
+    page = registry.query(offset=1, limit=2)
+    assert page.total == 4
+    assert [t.group_id for t in page.tasks] == ["b_sm", "b_pub"]
+
+    page = registry.query(group_prefix="b_")
+    assert [t.get_name() for t in page.tasks] == ["b_sm:stop_poll", "b_pub:planned_1"]
+
+    page = registry.query(name="start_poll")
+    assert [t.group_id for t in page.tasks] == ["a_sm", "c_sm"]
+
+    page = registry.query(
+        due_from=datetime(2024, 8, 1, 1, tzinfo=timezone.utc),
+        due_to=datetime(2024, 8, 1, 2, tzinfo=timezone.utc),
+    )
+    assert page.total == 2
+    assert [t.group_id for t in page.tasks] == ["b_sm", "b_pub"]
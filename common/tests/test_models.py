@@ -1,6 +1,6 @@
 import json
 from pathlib import Path
-from datetime import datetime, time
+from datetime import date, datetime, time, timedelta, timezone
 
 import pytest
 
@@ -82,3 +82,53 @@ def test_rrule_with_recurring_exceptions(
 
     assert teavent.start == datetime(2024, 8, 30, 21, 00, tzinfo=teavent.tz)
     assert teavent.start_poll_at == datetime(2024, 8, 30, 11, 00, tzinfo=teavent.tz)
+
+
+def test_recurrence_set_follows_exceptions(
+    now: datetime, teavent: Teavent, recurring_exception: Teavent
+):
+    assert teavent._next_recurrence(now, []).date() == date(2024, 8, 28)
+
+    # exdate of the exception is added to the cached set
+    recurrence = teavent._recurrence
+    assert teavent._next_recurrence(now, [recurring_exception]).date() == date(
+        2024, 8, 30
+    )
+    assert teavent._recurrence is recurrence
+
+    # the exception is gone: the set is rebuilt without its exdate
+    assert teavent._next_recurrence(now, []).date() == date(2024, 8, 28)
+    assert teavent._recurrence is not recurrence
+
+    teavent.rrule = ["RRULE:FREQ=WEEKLY;WKST=MO;BYDAY=TH"]
+    assert teavent._next_recurrence(now, []).date() == date(2024, 8, 29)
+
+
+def test_recurrence_cache_keeps_zones_apart(teavent: Teavent):
+    # the same instant: Wednesday in Tbilisi, but still Tuesday in UTC
+    tbilisi_start = datetime(2024, 7, 31, 1, 0, tzinfo=teavent.tz)
+    utc_start = tbilisi_start.astimezone(timezone.utc)
+    now = datetime(2024, 8, 1, tzinfo=timezone.utc)
+
+    tbilisi = teavent.model_copy(
+        update={
+            "start": tbilisi_start,
+            "end": tbilisi_start + timedelta(hours=1),
+            "original_start_time": tbilisi_start,
+            "rrule": ["RRULE:FREQ=WEEKLY;BYDAY=TU"],
+        }
+    )
+    utc = tbilisi.model_copy(
+        update={
+            "start": utc_start,
+            "end": utc_start + timedelta(hours=1),
+            "original_start_time": utc_start,
+        }
+    )
+
+    assert tbilisi._next_recurrence(now, []) == datetime(
+        2024, 8, 6, 1, 0, tzinfo=teavent.tz
+    )
+    assert utc._next_recurrence(now, []) == datetime(
+        2024, 8, 6, 21, 0, tzinfo=timezone.utc
+    )
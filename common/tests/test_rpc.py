@@ -0,0 +1,131 @@
+import asyncio
+
+from attr import define, field
+import pydantic
+import pytest
+
+from common import codecs, rpc
+from common.errors import TeaventIsManaged, UnknownTeavent
+from common.models import Teavent
+
+
+def _roundtrip(value):
+    codec = codecs.MessageCodec(codecs.COMPACT)
+    encoded = codec.encode(codecs.to_plain(value))
+    plain = codecs.decode(encoded.body, encoded.content_type, encoded.content_encoding)
+    return codecs.from_plain(plain)
+
+
+@define
+class FakeRPC:
+    """Routes calls to registered functions through the payload codec"""
+
+    routes: dict = field(factory=dict)
+    delay: float = 0
+
+    async def register(self, method_name: str, func, **kwargs):
+        self.routes[method_name] = func
+
+    async def call(self, method_name: str, kwargs: dict, expiration: int = None):
+        await asyncio.sleep(self.delay)
+        return _roundtrip(self.routes[method_name](**_roundtrip(kwargs)))
+
+
+@pytest.fixture
+def teavents(teavent: Teavent) -> dict[str, Teavent]:
+    return {teavent.id: teavent}
+
+
+@pytest.fixture
+async def client(teavents: dict[str, Teavent]) -> rpc.RpcClient:
+    fake = FakeRPC()
+    server = rpc.RpcServer(fake)
+
+    @server.handler(rpc.GetTeavent)
+    def get_teavent(request: rpc.GetTeavent) -> Teavent:
+        try:
+            return teavents[request.id]
+        except KeyError:
+            raise UnknownTeavent(request.id)
+
+    @server.handler(rpc.ManageTeavent)
+    def manage_teavent(request: rpc.ManageTeavent):
+        if request.teavent.id in teavents:
+            raise TeaventIsManaged(request.teavent)
+        teavents[request.teavent.id] = request.teavent
+
+    @server.handler(rpc.UserAction)
+    def user_action(request: rpc.UserAction):
+        raise RuntimeError(f"'{request.user_id}' has already confirmed")
+
+    await server.register()
+    return rpc.RpcClient(fake, timeout=0.1)
+
+
+async def test_call(client: rpc.RpcClient, teavent: Teavent):
+    assert await client.call(rpc.GetTeavent(id=teavent.id)) == teavent
+    assert await client.proxy(rpc.GetTeavent)(id=teavent.id) == teavent
+
+
+@pytest.mark.parametrize(
+    "request_, code",
+    [
+        (rpc.GetTeavent(id="nope"), rpc.ErrorCode.UNKNOWN_TEAVENT),
+        (
+            rpc.UserAction(type="confirm", user_id="@a", teavent_id="t"),
+            rpc.ErrorCode.REJECTED,
+        ),
+    ],
+)
+async def test_errors_are_mapped_to_codes(client: rpc.RpcClient, request_, code):
+    with pytest.raises(rpc.RpcError) as e:
+        await client.call(request_)
+
+    assert e.value.code == code
+
+
+@pytest.mark.parametrize(
+    "cls, kwargs",
+    [
+        (rpc.Tasks, {"offset": -1}),
+        (rpc.Tasks, {"limit": 0}),
+        (rpc.QueryTeavents, {"limit": 0}),
+        (rpc.QueryTeavents, {"limit": -1}),
+        (rpc.QueryTeavents, {"limit": rpc.MAX_PAGE_SIZE + 1}),
+    ],
+)
+def test_page_bounds(cls: type[rpc.Request], kwargs: dict):
+    with pytest.raises(pydantic.ValidationError):
+        cls(**kwargs)
+
+
+def test_unhandled_request_is_invalid():
+    reply = rpc.RpcServer(FakeRPC()).execute(rpc.Tasks())
+
+    assert reply.error.code == rpc.ErrorCode.INVALID_REQUEST
+
+
+async def test_batch(client: rpc.RpcClient, teavent: Teavent):
+    new = teavent.model_copy(update={"id": "new"})
+
+    replies = await client.batch(
+        [
+            rpc.ManageTeavent(teavent=teavent),
+            rpc.ManageTeavent(teavent=new),
+            rpc.GetTeavent(id="new"),
+        ]
+    )
+
+    assert [r.ok for r in replies] == [False, True, True]
+    assert replies[0].error.code == rpc.ErrorCode.IS_MANAGED
+    assert replies[2].result == new
+    assert await client.batch([]) == []
+
+
+async def test_timeout(client: rpc.RpcClient, teavent: Teavent):
+    client._rpc.delay = 1
+
+    with pytest.raises(rpc.RpcError) as e:
+        await client.call(rpc.GetTeavent(id=teavent.id))
+
+    assert e.value.code == rpc.ErrorCode.TIMEOUT
@@ -0,0 +1,30 @@
+from common.models import Teavent
+from common.updates import diff, patch
+
+
+def test_diff_list_operations():
+    old = {"participant_ids": ["a", "b", "c"], "latees": [], "state": "poll_open"}
+    new = {"participant_ids": ["a", "c"], "latees": ["a"], "state": "planned"}
+
+    assert diff(old, new) == [
+        {"op": "remove", "path": "participant_ids", "values": ["b"]},
+        {"op": "append", "path": "latees", "values": ["a"]},
+        {"op": "set", "path": "state", "value": "planned"},
+    ]
+
+
+def test_patch_roundtrip(teavent: Teavent):
+    teavent.participant_ids = ["a", "b", "c"]
+    base = teavent.snapshot()
+
+    changed = teavent.model_copy(deep=True)
+    changed.version += 1
+    changed.participant_ids.remove("b")
+    changed.participant_ids.append("d")
+    changed.state = "planned"
+    changed.config.max = 10
+
+    patched = patch(teavent, diff(base.document, changed.snapshot().document))
+
+    assert patched.snapshot().document == changed.snapshot().document
+    assert teavent.participant_ids == ["a", "b", "c"]
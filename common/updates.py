@@ -0,0 +1,217 @@
+"""Wire format of the `outgoing_updates` stream
+
+An update is either a full teavent snapshot or a delta against the previous
+published version of the same teavent. Deltas are lists of operations on
+top-level fields of the by-alias document:
+
+    {"op": "set", "path": "state", "value": "planned"}
+    {"op": "append", "path": "participant_ids", "values": ["@alice"]}
+    {"op": "remove", "path": "participant_ids", "values": ["@bob"]}
+
+Message headers carry `teavent_id`, `version`, `kind`, `epoch` and, for
+deltas, `base_version`, so consumers can order and drop updates without
+decoding.
+
+Versions are persisted write-behind, so after a crash eventmanager may count
+them again from a lower value. Each eventmanager process publishes with its
+own boot `epoch`, updates are ordered by `(epoch, version)`.
+"""
+
+import time
+from typing import Any
+
+import aio_pika
+from aio_pika.abc import AbstractIncomingMessage
+from attr import define
+import pydantic_core
+
+from common import codecs
+from common.models import Teavent, TeaventSnapshot
+
+SNAPSHOT = "snapshot"
+DELTA = "delta"
+
+_FIELD_NAMES = {
+    (field.alias or name): name for name, field in Teavent.model_fields.items()
+}
+
+
+def boot_epoch() -> int:
+    """Epoch of a starting publisher, later boots get greater ones"""
+    return time.time_ns() // 1_000_000
+
+
+@define(frozen=True)
+class TeaventUpdate:
+    teavent_id: str
+    version: int
+    kind: str
+    body: bytes
+    base_version: int | None = None
+    epoch: int = 0  # 0 for updates published before epochs
+
+    content_type: str = codecs.JSON
+    content_encoding: str | None = None
+    # plain document or ops, kept by the publisher to re-encode the JSON body
+    payload: Any = None
+
+    @staticmethod
+    def full(snapshot: TeaventSnapshot, epoch: int = 0) -> "TeaventUpdate":
+        return TeaventUpdate(
+            snapshot.id,
+            snapshot.version,
+            SNAPSHOT,
+            snapshot.body,
+            epoch=epoch,
+            payload=snapshot.document,
+        )
+
+    @staticmethod
+    def delta(
+        base: TeaventSnapshot, snapshot: TeaventSnapshot, epoch: int = 0
+    ) -> "TeaventUpdate":
+        ops = diff(base.document, snapshot.document)
+        return TeaventUpdate(
+            snapshot.id,
+            snapshot.version,
+            DELTA,
+            pydantic_core.to_json(ops),
+            base_version=base.version,
+            epoch=epoch,
+            payload=ops,
+        )
+
+    @property
+    def order(self) -> tuple[int, int]:
+        return (self.epoch, self.version)
+
+    @property
+    def is_delta(self) -> bool:
+        return self.kind == DELTA
+
+    def teavent(self) -> Teavent:
+        assert not self.is_delta
+        return codecs.decode_model(
+            Teavent, self.body, self.content_type, self.content_encoding
+        )
+
+    def ops(self) -> list[dict]:
+        assert self.is_delta
+        return codecs.decode(self.body, self.content_type, self.content_encoding)
+
+    def message(
+        self, codec: codecs.MessageCodec = codecs.MessageCodec()
+    ) -> aio_pika.Message:
+        if codec.is_plain(self.content_type, len(self.body)):
+            encoded = codecs.Encoded(self.body, self.content_type)
+        else:
+            encoded = codec.encode(self.payload)
+
+        headers = {"teavent_id": self.teavent_id, "version": self.version}
+        headers["kind"] = self.kind
+        headers["epoch"] = self.epoch
+        if self.base_version is not None:
+            headers["base_version"] = self.base_version
+
+        return aio_pika.Message(
+            encoded.body,
+            headers=headers,
+            content_type=encoded.content_type,
+            content_encoding=encoded.content_encoding,
+            delivery_mode=aio_pika.DeliveryMode.PERSISTENT,
+        )
+
+    @staticmethod
+    def from_message(message: AbstractIncomingMessage) -> "TeaventUpdate":
+        headers = message.headers or {}
+        if "kind" not in headers:
+            # published before updates had headers: a plain teavent document
+            teavent = Teavent.from_message(message)
+            return TeaventUpdate(
+                teavent.id,
+                teavent.version,
+                SNAPSHOT,
+                message.body,
+                content_type=message.content_type or codecs.JSON,
+                content_encoding=message.content_encoding or None,
+            )
+
+        return TeaventUpdate(
+            teavent_id=headers["teavent_id"],
+            version=headers["version"],
+            kind=headers["kind"],
+            body=message.body,
+            base_version=headers.get("base_version"),
+            epoch=headers.get("epoch", 0),
+            content_type=message.content_type or codecs.JSON,
+            content_encoding=message.content_encoding or None,
+        )
+
+
+def diff(old: dict, new: dict) -> list[dict]:
+    ops = []
+
+    for path, value in new.items():
+        prev = old.get(path)
+        if prev == value:
+            continue
+
+        if isinstance(prev, list) and isinstance(value, list):
+            if value[: len(prev)] == prev:
+                ops.append({"op": "append", "path": path, "values": value[len(prev) :]})
+                continue
+
+            removed = _removed(prev, value)
+            if removed is not None:
+                ops.append({"op": "remove", "path": path, "values": removed})
+                continue
+
+        ops.append({"op": "set", "path": path, "value": value})
+
+    return ops
+
+
+def patch(teavent: Teavent, ops: list[dict]) -> Teavent:
+    """New teavent with delta applied, the given one is left intact"""
+    patched = teavent.model_copy()
+
+    for op in ops:
+        name = _FIELD_NAMES[op["path"]]
+
+        match op["op"]:
+            case "set":
+                value = op["value"]
+            case "append":
+                value = [*getattr(patched, name), *op["values"]]
+            case "remove":
+                removed = list(op["values"])
+                value = []
+                for item in getattr(patched, name):
+                    if removed and item == removed[0]:
+                        removed.pop(0)
+                    else:
+                        value.append(item)
+            case unknown:
+                raise ValueError(f"Unknown delta operation '{unknown}'")
+
+        Teavent.__pydantic_validator__.validate_assignment(patched, name, value)
+
+    return patched
+
+
+def _removed(prev: list, value: list) -> list | None:
+    """Items removed from `prev` to get `value` if it is an ordered subsequence"""
+    removed = []
+    it = iter(value)
+    expected = next(it, _END)
+
+    for item in prev:
+        if item == expected:
+            expected = next(it, _END)
+        else:
+            removed.append(item)
+
+    return removed if expected is _END else None
+
+
+_END = object()
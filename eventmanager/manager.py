@@ -1,32 +1,100 @@
+import bisect
+import itertools
 import logging
-from collections.abc import Callable
+import math
+import time
+from collections.abc import Callable, Iterable
 from datetime import datetime
 
 from common.executors import Executor
-from common.models import Teavent
+from common.models import ImportResult, Teavent, TeaventsPage
 from common.errors import TeaventIsManaged, UnknownTeavent
 from common.flow import TeaventFlow
+from eventmanager.tasks_db import JournaledTask
 from eventmanager.transitions_logger import TransitionsLogger
 
 log = logging.getLogger(__name__)
 
+# user actions applied in bulk by `change_participants`
+_BULK_ACTIONS = {
+    TeaventFlow.confirm.name: "add",
+    TeaventFlow.reject.name: "remove",
+}
+
 
 class TeaventManager:
     def __init__(
         self,
         executor: Executor,
         listeners: list = None,
+        journal=None,
     ):
         self._executor: Executor = executor
         self._listeners: list = listeners or []
+        self._journal = journal
 
         self._statemachines: dict[str, TeaventFlow] = {}
+        # recurring_event_id -> its exceptions by id
+        self._recurring_exceptions: dict[str, dict[str, Teavent]] = {}
+
+        # query indexes
+        self._by_start: list[tuple[float, str]] = []  # sorted
+        self._start_keys: dict[str, tuple[float, str]] = {}
+        self._by_cal: dict[str, set[str]] = {}
+        self._by_chat: dict[str, set[str]] = {}
 
     def list_teavents(self) -> list[Teavent]:
         return list(sm.teavent for sm in self._statemachines.values())
 
+    def query_teavents(
+        self,
+        cal_id: str = None,
+        chat_id: str = None,
+        state: str = None,
+        start_from: datetime = None,
+        start_to: datetime = None,
+        cursor: str = None,
+        limit: int = 20,
+    ) -> TeaventsPage:
+        """Teavents ordered by start, paginated with an opaque cursor"""
+        if limit < 1:
+            raise ValueError(f"Page limit must be positive, got {limit}")
+
+        if cal_id is None and chat_id is None:
+            keys = self._by_start
+        else:
+            candidates = [
+                self._by_cal.get(cal_id, set()) if cal_id is not None else None,
+                self._by_chat.get(chat_id, set()) if chat_id is not None else None,
+            ]
+            ids = set.intersection(*(c for c in candidates if c is not None))
+            keys = sorted(self._start_keys[id] for id in ids)
+
+        if cursor is not None:
+            lo = bisect.bisect_right(keys, _parse_cursor(cursor))
+        elif start_from is not None:
+            lo = bisect.bisect_left(keys, (start_from.timestamp(),))
+        else:
+            lo = 0
+        hi_ts = start_to.timestamp() if start_to is not None else math.inf
+
+        teavents = []
+        last_key = None
+        for key in itertools.islice(keys, lo, None):
+            if key[0] > hi_ts:
+                break
+            if len(teavents) == limit:
+                return TeaventsPage(teavents=teavents, next_cursor=_cursor(last_key))
+
+            teavent = self._statemachines[key[1]].teavent
+            last_key = key
+            if state is None or teavent.state == state:
+                teavents.append(teavent)
+
+        return TeaventsPage(teavents=teavents)
+
     def get_teavent(self, id: str) -> Teavent:
-        return self._statemachines[id].teavent
+        return self._teavent_sm(id).teavent
 
     def handle_teavent(self, teavent: Teavent, initial_adjust=False):
         log.info(f"Handle teavent {teavent}")
@@ -44,6 +112,101 @@ class TeaventManager:
         else:
             raise TeaventIsManaged(teavent)
 
+    def manage_teavents(
+        self, teavents: Iterable[Teavent], upsert: bool = False
+    ) -> list[ImportResult]:
+        """Bulk-manage teavents of a calendar import
+
+        Recurring exceptions are managed first, so each series is adjusted once
+        against the managed exceptions and the ones of the batch. Ids repeated
+        in the batch are imported once. Already managed teavents are skipped or,
+        with `upsert`, replaced keeping their state and participants.
+        """
+        unique: dict[str, Teavent] = {}
+        for teavent in teavents:
+            if teavent.id in unique:
+                log.warning(f"Skip duplicate teavent {teavent.id} in import")
+                continue
+            unique[teavent.id] = teavent
+
+        results = {}
+        for teavent in sorted(unique.values(), key=lambda t: t.is_reccurring):
+            results[teavent.id] = self._import(teavent, upsert)
+
+        return [results[id] for id in unique]
+
+    def _import(self, teavent: Teavent, upsert: bool) -> ImportResult:
+        managed = self._statemachines.get(teavent.id)
+        if managed is not None and not upsert:
+            return ImportResult(id=teavent.id, status="skipped")
+
+        try:
+            if teavent.is_reccurring:
+                teavent.adjust(
+                    self._executor.now(teavent.tz),
+                    recurring_exceptions=self._get_recurring_exceptions(teavent.id),
+                )
+
+            if managed is not None:
+                self._unmanage(managed.teavent)
+                _carry_over(managed.teavent, teavent)
+
+            self._manage(teavent)
+        except Exception as e:
+            log.exception(f"Failed to import teavent {teavent.id}")
+            if teavent.id in self._statemachines:
+                self._unmanage(teavent)
+            if managed is not None:
+                self._manage(managed.teavent)
+            return ImportResult(id=teavent.id, status="failed", error=str(e))
+
+        return ImportResult(
+            id=teavent.id, status="managed" if managed is None else "updated"
+        )
+
+    def load_teavents(
+        self, teavents: Iterable[Teavent], journal: dict[str, JournaledTask] = None
+    ):
+        """Bulk-manage stored teavents: index all of them first, then reschedule
+        journaled triggers and init the rest"""
+        journal = journal or {}
+
+        started = time.perf_counter()
+        statemachines = []
+        for teavent in teavents:
+            if teavent.id in self._statemachines:
+                log.warning(f"Skip duplicate teavent {teavent.id}")
+                continue
+            statemachines.append(self._add_statemachine(teavent))
+        log.info(f"Ingested {len(statemachines)} teavents in {_since(started):.3f}s")
+
+        started = time.perf_counter()
+        to_init = []
+        for sm in statemachines:
+            task = journal.get(_sm_group(sm.teavent.id))
+            if task is None:
+                to_init.append(sm)
+            elif task.name not in (t.event for t in sm.current_state.transitions):
+                log.warning(
+                    f"Journaled {task} does not match state '{sm.teavent.state}'"
+                )
+                to_init.append(sm)
+            else:
+                trigger = getattr(TeaventFlow, task.name)
+                self._schedule(trigger, sm.teavent, task.at, journal=False)
+        restored = len(statemachines) - len(to_init)
+        log.info(f"Restored {restored} journaled tasks in {_since(started):.3f}s")
+
+        started = time.perf_counter()
+        for sm in to_init:
+            try:
+                self._init(sm)
+            except Exception:
+                log.exception(f"Failed to init teavent {sm.teavent.id}, skip it")
+                if sm.teavent.id in self._statemachines:
+                    self._unmanage(sm.teavent)
+        log.info(f"Initialized {len(to_init)} teavents in {_since(started):.3f}s")
+
     def handle_user_action(self, type: str, user_id: str, teavent_id: str, force: bool):
         sm = self._teavent_sm(teavent_id)
         sm.send(
@@ -55,21 +218,87 @@ class TeaventManager:
         )
         return sm.teavent
 
-    def _manage(self, teavent: Teavent):
+    def handle_user_actions(
+        self, type: str, user_ids: list[str], teavent_id: str, force: bool
+    ):
+        """Confirm or reject many users as one transition: validated at once,
+        persisted and published as a single update"""
+        try:
+            change = _BULK_ACTIONS[type]
+        except KeyError:
+            raise ValueError(f"'{type}' can not be applied in bulk")
+
+        sm = self._teavent_sm(teavent_id)
+        if not user_ids:
+            return sm.teavent
+
+        sm.send(
+            "change_participants",
+            **{"add": [], "remove": [], change: user_ids},
+            force=force,
+            now=self._executor.now(sm.teavent.tz),
+            recurring_exceptions=self._get_recurring_exceptions(sm.teavent.id),
+        )
+        return sm.teavent
+
+    def _add_statemachine(self, teavent: Teavent) -> TeaventFlow:
         assert teavent.id not in self._statemachines
 
         sm = TeaventFlow(
             model=teavent,
             state_field="state",
-            listeners=[*self._listeners, self, TransitionsLogger()],
+            # manager goes first: it builds the snapshot the others reuse
+            listeners=[self, *self._listeners, TransitionsLogger()],
         )
+        self._statemachines[teavent.id] = sm
+
+        if teavent.is_recurring_exception:
+            series_id = teavent.recurring_event_id
+            self._recurring_exceptions.setdefault(series_id, {})[teavent.id] = teavent
+
+        self._index_start(teavent)
+        self._by_cal.setdefault(teavent.cal_id, set()).add(teavent.id)
+        for chat_id in teavent.communication_ids:
+            self._by_chat.setdefault(chat_id, set()).add(teavent.id)
+
+        return sm
 
+    def _remove_statemachine(self, teavent_id: str):
+        teavent = self._statemachines.pop(teavent_id).teavent
+
+        if teavent.is_recurring_exception:
+            exceptions = self._recurring_exceptions[teavent.recurring_event_id]
+            del exceptions[teavent_id]
+            if not exceptions:
+                del self._recurring_exceptions[teavent.recurring_event_id]
+
+        self._unindex_start(teavent_id)
+        _discard(self._by_cal, teavent.cal_id, teavent_id)
+        for chat_id in teavent.communication_ids:
+            _discard(self._by_chat, chat_id, teavent_id)
+
+    def _index_start(self, teavent: Teavent):
+        key = (teavent.start.timestamp(), teavent.id)
+        bisect.insort(self._by_start, key)
+        self._start_keys[teavent.id] = key
+
+    def _unindex_start(self, teavent_id: str):
+        key = self._start_keys.pop(teavent_id)
+        del self._by_start[bisect.bisect_left(self._by_start, key)]
+
+    def _unmanage(self, teavent: Teavent):
+        self._cancel_tasks(_sm_group(teavent.id))
+        self._remove_statemachine(teavent.id)
+
+    def _manage(self, teavent: Teavent):
         # all recurring_exceptions must be managed
         # TODO: handle recurring exceptions properly
-        self._statemachines[teavent.id] = sm
+        self._init(self._add_statemachine(teavent))
+
+    def _init(self, sm: TeaventFlow):
         sm.init(
-            now=self._executor.now(teavent.tz),
-            recurring_exceptions=self._get_recurring_exceptions(teavent.id),
+            now=self._executor.now(sm.teavent.tz),
+            recurring_exceptions=self._get_recurring_exceptions(sm.teavent.id),
         )
 
     def _teavent_sm(self, teavent_id: str) -> TeaventFlow:
@@ -85,8 +314,10 @@ class TeaventManager:
         except KeyError:
             pass
 
-    def _schedule(self, trigger: Callable, teavent: Teavent, at: datetime):
-        group_id = f"{teavent.id}_sm"
+    def _schedule(
+        self, trigger: Callable, teavent: Teavent, at: datetime, journal: bool = True
+    ):
+        group_id = _sm_group(teavent.id)
         self._cancel_tasks(group_id)
 
         delay = (at - self._executor.now(tz=at.tzinfo)).total_seconds()
@@ -97,15 +328,27 @@ class TeaventManager:
             delay_seconds=delay,
         )
 
+        if journal and self._journal is not None:
+            self._journal.record(group_id, trigger.name, at)
+
     def _get_recurring_exceptions(self, recurring_teavent_id: str) -> list[Teavent]:
-        return [
-            t
-            for t in self.list_teavents()
-            if t.recurring_event_id == recurring_teavent_id
-        ]
+        return list(self._recurring_exceptions.get(recurring_teavent_id, {}).values())
 
     # SM actions
 
+    def before_transition(self, model: Teavent):
+        model.version += 1
+
+    def after_transition(self, model: Teavent):
+        # serialised once here, shared by storage and publishing
+        model.snapshot()
+
+        # start is shifted on recreate
+        key = self._start_keys.get(model.id)
+        if key is not None and key[0] != model.start.timestamp():
+            self._unindex_start(model.id)
+            self._index_start(model)
+
     @TeaventFlow.created.enter
     def _schedule_start_poll(self, model: Teavent):
         self._schedule(
@@ -154,5 +397,40 @@ class TeaventManager:
 
     @TeaventFlow.finalized.enter
     def _drop(self, model: Teavent):
-        self._cancel_tasks(f"{model.id}_sm")
-        self._statemachines.pop(model.id)
+        self._unmanage(model)
+
+        if self._journal is not None:
+            self._journal.discard(_sm_group(model.id))
+
+
+def _discard(index: dict[str, set[str]], key: str, teavent_id: str):
+    ids = index[key]
+    ids.discard(teavent_id)
+    if not ids:
+        del index[key]
+
+
+def _cursor(key: tuple[float, str]) -> str:
+    return f"{key[0]!r}|{key[1]}"
+
+
+def _parse_cursor(cursor: str) -> tuple[float, str]:
+    ts, teavent_id = cursor.split("|", 1)
+    return (float(ts), teavent_id)
+
+
+def _carry_over(old: Teavent, new: Teavent):
+    """Keep what eventmanager owns when a teavent is re-imported from calendar"""
+    new.state = old.state
+    new.participant_ids = old.participant_ids
+    new.latees = old.latees
+    new.effective_max_ = old.effective_max_
+    new.version = old.version
+
+
+def _sm_group(teavent_id: str) -> str:
+    return f"{teavent_id}_sm"
+
+
+def _since(started: float) -> float:
+    return time.perf_counter() - started
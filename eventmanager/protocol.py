@@ -1,38 +1,182 @@
+import asyncio
 import logging
+import time
+from collections import deque
 
 import aio_pika
-from attr import define
+from attr import define, field
 from statemachine import State
 
+from common import codecs
 from common.executors import Executor
-from common.models import Teavent
-from common.pika_pydantic import ModelMessage
+from common.models import Teavent, TeaventSnapshot
+from common.updates import TeaventUpdate, boot_epoch
 
 log = logging.getLogger(__name__)
 
 
+@define
+class PublishStats:
+    published: int = 0
+    snapshots: int = 0
+    bytes: int = 0
+    failed: int = 0
+    batches: int = 0
+    total_latency: float = 0.0
+    max_latency: float = 0.0
+
+    def record(self, latency: float):
+        self.published += 1
+        self.total_latency += latency
+        self.max_latency = max(self.max_latency, latency)
+
+    @property
+    def avg_latency(self) -> float:
+        return self.total_latency / self.published if self.published else 0.0
+
+
+@define
+class _Outgoing:
+    update: TeaventUpdate
+    enqueued_at: float
+
+
 @define(eq=False)  # eq=False is required to be listener
 class RmqProtocol:
+    """Publishes teavent updates in transition order
+
+    Updates go through a single queue drained by one task, so updates of a
+    teavent never overtake each other. Publishes of a batch are pipelined and
+    their publisher confirms are awaited together; a failed batch is put back
+    in front of the queue and retried.
+
+    An update is a delta against the previous update of the teavent; a full
+    snapshot is sent first, every `snapshot_every` updates, on final states
+    and when the delta is not smaller. Updates carry the `epoch` of this boot.
+    """
+
     _outgoing_updates_queue: aio_pika.abc.AbstractQueue
     _channel: aio_pika.abc.AbstractChannel
 
     _executor: Executor
 
-    _pub_id: int = 0  # TODO: mb better way?
+    _batch_size: int = 100
+    _retry_delay: float = 1.0
+    _snapshot_every: int = 20
+    _epoch: int = field(factory=boot_epoch)
+    # JSON bodies of snapshots are published as built, other codecs re-encode
+    _codec: codecs.MessageCodec = field(factory=codecs.MessageCodec)
+
+    # per teavent: last enqueued snapshot and deltas sent since a full one
+    _last: dict[str, tuple[TeaventSnapshot, int]] = field(factory=dict)
+
+    _backlog: deque[_Outgoing] = field(factory=deque)
+    _draining: bool = False
+    _publish_lock: asyncio.Lock = field(factory=asyncio.Lock)
+    _drain_id: int = 0
+
+    stats: PublishStats = field(factory=PublishStats)
 
-    async def _publish_update(self, teavent: Teavent):
-        await self._channel.default_exchange.publish(
-            ModelMessage(teavent),
-            routing_key=self._outgoing_updates_queue.name,
+    def backlog(self) -> dict:
+        oldest = (
+            time.perf_counter() - self._backlog[0].enqueued_at if self._backlog else 0
         )
+        return {"size": len(self._backlog), "oldest_age": oldest}
 
-    # SM actions
+    async def flush(self):
+        """Publish the whole backlog now, e.g. on shutdown"""
+        while self._backlog:
+            await self._publish_next()
 
-    def after_transition(self, state: State, model: Teavent):
-        self._pub_id += 1
+    async def _drain(self):
+        retry = False
+
+        try:
+            while self._backlog:
+                try:
+                    await self._publish_next()
+                except Exception:
+                    log.exception("Failed to publish updates, retry")
+                    retry = True
+                    return
+        finally:
+            self._draining = False
+            if retry:
+                self._schedule_drain(self._retry_delay)
+
+    async def _publish_next(self):
+        # one batch at a time, so a flush never overtakes a drain
+        async with self._publish_lock:
+            batch = [
+                self._backlog.popleft()
+                for _ in range(min(self._batch_size, len(self._backlog)))
+            ]
+            if not batch:
+                return
+
+            try:
+                await self._publish_batch(batch)
+            except Exception:
+                self.stats.failed += len(batch)
+                self._backlog.extendleft(reversed(batch))
+                raise
+
+            now = time.perf_counter()
+            for outgoing in batch:
+                self.stats.record(now - outgoing.enqueued_at)
+            self.stats.batches += 1
+
+    async def _publish_batch(self, batch: list[_Outgoing]):
+        messages = [outgoing.update.message(self._codec) for outgoing in batch]
+
+        # the channel serializes frames in call order, confirms are awaited together
+        await asyncio.gather(
+            *(
+                self._channel.default_exchange.publish(
+                    message, routing_key=self._outgoing_updates_queue.name
+                )
+                for message in messages
+            )
+        )
+
+        self.stats.bytes += sum(len(message.body) for message in messages)
+
+    def _schedule_drain(self, delay_seconds: float = 0):
+        self._draining = True
+        self._drain_id += 1
 
         self._executor.schedule(
-            self._publish_update(model.model_copy()),
-            group_id=f"{model.id}_pub",
-            name=f"{state.value}_{self._pub_id}",
+            self._drain(),
+            group_id="rmq_protocol",
+            name=f"drain_{self._drain_id}",
+            delay_seconds=delay_seconds,
         )
+
+    # SM actions
+
+    def after_transition(self, state: State, model: Teavent):
+        update = self._encode(model.snapshot(), final=state.final)
+        self._backlog.append(_Outgoing(update, time.perf_counter()))
+
+        if not self._draining:
+            self._schedule_drain()
+
+    def _encode(self, snapshot: TeaventSnapshot, final: bool) -> TeaventUpdate:
+        if final:
+            # the teavent is dropped, consumers must get its last state as is
+            self._last.pop(snapshot.id, None)
+            return self._full(snapshot)
+
+        base, deltas = self._last.get(snapshot.id, (None, 0))
+        if base is not None and deltas + 1 < self._snapshot_every:
+            update = TeaventUpdate.delta(base, snapshot, self._epoch)
+            if len(update.body) < len(snapshot.body):
+                self._last[snapshot.id] = (snapshot, deltas + 1)
+                return update
+
+        self._last[snapshot.id] = (snapshot, 0)
+        return self._full(snapshot)
+
+    def _full(self, snapshot: TeaventSnapshot) -> TeaventUpdate:
+        self.stats.snapshots += 1
+        return TeaventUpdate.full(snapshot, self._epoch)
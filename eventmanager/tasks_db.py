@@ -0,0 +1,106 @@
+import asyncio
+import logging
+from datetime import datetime
+
+import motor.motor_asyncio as aio_mongo
+from attr import define, field
+from pymongo import DeleteOne, ReplaceOne
+
+from common.executors import Executor
+
+log = logging.getLogger(__name__)
+
+_DISCARDED = None
+
+
+@define(frozen=True)
+class JournaledTask:
+    group_id: str
+    name: str
+    at: datetime
+
+
+@define(eq=False)
+class TasksDB:
+    """Journal of scheduled state machine triggers, one document per task group
+
+    Write-behind as `TeaventsDB`: keeps only the latest task or discard per
+    group and flushes them with a single bulk_write, so a discard is never
+    overtaken by an earlier record.
+    """
+
+    _storage: aio_mongo.AsyncIOMotorCollection
+    _executor: Executor
+
+    _flush_interval: float = 0.5
+    _max_pending: int = 100
+
+    _pending: dict[str, JournaledTask | None] = field(factory=dict)
+    _flush_lock: asyncio.Lock = field(factory=asyncio.Lock)
+    _flush_scheduled: bool = False
+    _flush_id: int = 0
+
+    async def fetch_tasks(self) -> dict[str, JournaledTask]:
+        return {
+            document["_id"]: JournaledTask(
+                group_id=document["_id"],
+                name=document["name"],
+                at=datetime.fromisoformat(document["at"]),
+            )
+            async for document in self._storage.find()
+        }
+
+    def record(self, group_id: str, name: str, at: datetime):
+        self._mark(group_id, JournaledTask(group_id, name, at))
+
+    def discard(self, group_id: str):
+        self._mark(group_id, _DISCARDED)
+
+    async def flush(self):
+        async with self._flush_lock:
+            pending, self._pending = self._pending, {}
+            self._flush_scheduled = False
+
+            if not pending:
+                return
+
+            try:
+                await self._storage.bulk_write(
+                    [_to_operation(id, task) for id, task in pending.items()],
+                    ordered=False,
+                )
+            except Exception:
+                log.exception(f"Failed to flush {len(pending)} journaled tasks, retry")
+                for id, task in pending.items():
+                    self._pending.setdefault(id, task)
+                self._schedule_flush(self._flush_interval)
+
+    def _mark(self, group_id: str, task: JournaledTask | None):
+        self._pending[group_id] = task
+
+        if len(self._pending) == self._max_pending:
+            self._schedule_flush(0)
+        elif not self._flush_scheduled:
+            self._schedule_flush(self._flush_interval)
+
+    def _schedule_flush(self, delay_seconds: float):
+        self._flush_scheduled = True
+        self._flush_id += 1
+
+        self._executor.schedule(
+            self.flush(),
+            group_id="tasks_db",
+            name=f"flush_{self._flush_id}",
+            delay_seconds=delay_seconds,
+        )
+
+
+def _to_operation(group_id: str, task: JournaledTask | None):
+    if task is _DISCARDED:
+        return DeleteOne({"_id": group_id})
+
+    return ReplaceOne(
+        filter={"_id": group_id},
+        replacement={"name": task.name, "at": task.at.isoformat()},
+        upsert=True,
+    )
@@ -1,45 +1,97 @@
+import asyncio
+import logging
+
 import motor.motor_asyncio as aio_mongo
-from attr import define
+from attr import define, field
+from pymongo import DeleteOne, ReplaceOne
 from statemachine import State
 
 from common.executors import Executor
-from common.models import Teavent
-from common.flow import TeaventFlow
+from common.models import Teavent, TeaventSnapshot
+
+log = logging.getLogger(__name__)
+
+_DROPPED = None
 
 
 @define(eq=False)  # eq=False is required to be listener
 class TeaventsDB:
+    """Write-behind storage: keeps only the latest dirty teavent per id
+    and flushes them with a single bulk_write"""
+
     _storage: aio_mongo.AsyncIOMotorCollection
     _executor: Executor
 
-    _update_id: int = 0
+    _flush_interval: float = 0.5
+    _max_pending: int = 100
+
+    _pending: dict[str, TeaventSnapshot | None] = field(factory=dict)
+    _flush_lock: asyncio.Lock = field(factory=asyncio.Lock)
+    _flush_scheduled: bool = False
+    _flush_id: int = 0
 
     async def fetch_teavents(self):
         async for document in self._storage.find():
             yield Teavent(**document)
 
+    async def flush(self):
+        # flushes are serialized, so a later snapshot never lands before an earlier one
+        async with self._flush_lock:
+            pending, self._pending = self._pending, {}
+            self._flush_scheduled = False
+
+            if not pending:
+                return
+
+            try:
+                await self._storage.bulk_write(
+                    [_to_operation(id, s) for id, s in pending.items()],
+                    ordered=False,
+                )
+            except Exception:
+                log.exception(f"Failed to flush {len(pending)} teavents, retry")
+                for id, snapshot in pending.items():
+                    self._pending.setdefault(id, snapshot)
+                self._schedule_flush(self._flush_interval)
+
+    def _mark(self, teavent_id: str, snapshot: TeaventSnapshot | None):
+        self._pending[teavent_id] = snapshot
+
+        if len(self._pending) == self._max_pending:
+            self._schedule_flush(0)
+        elif not self._flush_scheduled:
+            self._schedule_flush(self._flush_interval)
+
+    def _schedule_flush(self, delay_seconds: float):
+        self._flush_scheduled = True
+        self._flush_id += 1
+
+        self._executor.schedule(
+            self.flush(),
+            group_id="teavents_db",
+            name=f"flush_{self._flush_id}",
+            delay_seconds=delay_seconds,
+        )
+
     # SM actions
 
     def after_transition(self, state: State, model: Teavent):
         if state.final:
             return
 
-        self._update_id += 1
+        self._mark(model.id, model.snapshot())
 
-        self._executor.schedule(
-            self._storage.replace_one(
-                filter={"_id": model.id},
-                replacement=model.model_dump(mode="json", by_alias=True),
-                upsert=True,
-            ),
-            group_id=f"{model.id}_db",
-            name=f"update_{self._update_id}",
-        )
+    def on_enter_finalized(self, model: Teavent):
+        # replaces any pending write of the same teavent
+        self._mark(model.id, _DROPPED)
 
-    @TeaventFlow.finalized.enter
-    def _drop_from_storage(self, model: Teavent):
-        self._executor.schedule(
-            self._storage.delete_one({"_id": model.id}),
-            group_id=f"{model.id}_db",
-            name="drop",
-        )
+
+def _to_operation(teavent_id: str, snapshot: TeaventSnapshot | None):
+    if snapshot is _DROPPED:
+        return DeleteOne({"_id": teavent_id})
+
+    return ReplaceOne(
+        filter={"_id": teavent_id},
+        replacement=snapshot.document,
+        upsert=True,
+    )
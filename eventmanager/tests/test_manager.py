@@ -1,11 +1,13 @@
-from datetime import datetime
+from datetime import datetime, timedelta
 import logging
 
 import pytest
+from statemachine.exceptions import TransitionNotAllowed
 
 from common.executors import Executor
 from common.models import Teavent
 from eventmanager.manager import TeaventManager
+from eventmanager.tasks_db import JournaledTask
 
 
 class FakeExecutor(Executor):
@@ -80,3 +82,239 @@ def test_handle_started_teavent_after_end(
 
     fake_executor.execute_current_tasks()
     assert teavent.state == "created"
+
+
+class TransitionsSpy:
+    def __init__(self):
+        self.events = []
+
+    def after_transition(self, event: str):
+        self.events.append(event)
+
+
+@pytest.mark.parametrize("teavent", [{"state": "poll_open"}], indirect=True)
+@pytest.mark.parametrize(
+    "fake_executor", [{"now": datetime(2024, 7, 31, 12, 0)}], indirect=True
+)
+def test_load_teavent_from_journal(teavent: Teavent, fake_executor: FakeExecutor):
+    spy = TransitionsSpy()
+    manager = TeaventManager(executor=fake_executor, listeners=[spy])
+
+    group_id = f"{teavent.id}_sm"
+    journal = {group_id: JournaledTask(group_id, "stop_poll", teavent.stop_poll_at)}
+    manager.load_teavents([teavent], journal)
+
+    # trigger is rescheduled without replaying init
+    assert spy.events == []
+    assert teavent.state == "poll_open"
+
+    fake_executor.execute_current_tasks()
+    assert spy.events[0] == "stop_poll"
+
+
+@pytest.mark.parametrize("teavent", [{"state": "poll_open"}], indirect=True)
+@pytest.mark.parametrize(
+    "fake_executor", [{"now": datetime(2024, 7, 31, 12, 0)}], indirect=True
+)
+def test_load_teavent_with_stale_journal(teavent: Teavent, fake_executor: FakeExecutor):
+    spy = TransitionsSpy()
+    manager = TeaventManager(executor=fake_executor, listeners=[spy])
+
+    group_id = f"{teavent.id}_sm"
+    journal = {group_id: JournaledTask(group_id, "end", teavent.end)}
+    manager.load_teavents([teavent], journal)
+
+    assert spy.events == ["init"]
+
+
+@pytest.fixture
+def recurring_exception(teavent: Teavent):
+    return teavent.model_copy(
+        update={
+            "id": f"{teavent.id}_20240805T170000Z",
+            "rrule": None,
+            "recurring_event_id": teavent.id,
+        },
+        deep=True,
+    )
+
+
+@pytest.mark.parametrize(
+    "fake_executor", [{"now": datetime(2024, 7, 31, 12, 0)}], indirect=True
+)
+def test_recurring_exceptions_index(
+    manager: TeaventManager, teavent: Teavent, recurring_exception: Teavent
+):
+    manager.handle_teavent(recurring_exception)
+    manager.handle_teavent(teavent)
+
+    assert manager._get_recurring_exceptions(teavent.id) == [recurring_exception]
+
+    manager.handle_user_action(
+        type="cancel", user_id="admin", teavent_id=recurring_exception.id, force=True
+    )
+
+    assert recurring_exception.state == "finalized"
+    assert manager._get_recurring_exceptions(teavent.id) == []
+
+
+@pytest.mark.parametrize("teavent", [{"state": "started"}], indirect=True)
+@pytest.mark.parametrize(
+    "fake_executor", [{"now": datetime(2024, 7, 31, 23, 30)}], indirect=True
+)
+def test_load_teavents_indexes_exceptions_before_init(
+    manager: TeaventManager,
+    teavent: Teavent,
+    recurring_exception: Teavent,
+    fake_executor: FakeExecutor,
+):
+    # the next occurrence (Fri, Aug 2) is moved
+    recurring_exception.start = datetime(2024, 8, 2, 19, 0, tzinfo=teavent.tz)
+    recurring_exception.end = datetime(2024, 8, 2, 21, 0, tzinfo=teavent.tz)
+    recurring_exception.state = "created"
+
+    manager.load_teavents([teavent, recurring_exception])
+
+    fake_executor.execute_current_tasks()
+    assert teavent.state == "created"
+    assert teavent.start == datetime(2024, 8, 5, 21, 0, tzinfo=teavent.tz)
+
+
+@pytest.mark.parametrize(
+    "fake_executor", [{"now": datetime(2024, 7, 31, 12, 0)}], indirect=True
+)
+def test_query_teavents(manager: TeaventManager, teavent: Teavent):
+    teavents = []
+    for day in range(5):
+        t = teavent.model_copy(
+            update={
+                "id": f"t{day}",
+                "rrule": None,
+                "start": teavent.start + timedelta(days=4 - day),
+                "end": teavent.end + timedelta(days=4 - day),
+                "communication_ids": ["chat1" if day % 2 else "chat2"],
+            },
+            deep=True,
+        )
+        manager.handle_teavent(t)
+        teavents.append(t)
+
+    page = manager.query_teavents(limit=2)
+    assert [t.id for t in page.teavents] == ["t4", "t3"]
+
+    page = manager.query_teavents(cursor=page.next_cursor, limit=2)
+    assert [t.id for t in page.teavents] == ["t2", "t1"]
+
+    page = manager.query_teavents(cursor=page.next_cursor, limit=2)
+    assert [t.id for t in page.teavents] == ["t0"]
+    assert page.next_cursor is None
+
+    with pytest.raises(ValueError):
+        manager.query_teavents(limit=0)
+
+    page = manager.query_teavents(chat_id="chat1")
+    assert [t.id for t in page.teavents] == ["t3", "t1"]
+
+    page = manager.query_teavents(start_from=teavents[2].start)
+    assert [t.id for t in page.teavents] == ["t2", "t1", "t0"]
+
+    manager.handle_user_action(type="cancel", user_id="1", teavent_id="t3", force=True)
+    page = manager.query_teavents(chat_id="chat1")
+    assert [t.id for t in page.teavents] == ["t1"]
+
+
+@pytest.mark.parametrize("teavent", [{"state": "poll_open"}], indirect=True)
+@pytest.mark.parametrize(
+    "fake_executor", [{"now": datetime(2024, 7, 31, 12, 0)}], indirect=True
+)
+def test_version_bumped_on_every_transition(manager: TeaventManager, teavent: Teavent):
+    manager.handle_teavent(teavent)
+    assert teavent.version == 1  # init
+
+    manager.handle_user_action("confirm", "@alice", teavent.id, force=False)
+    assert teavent.version == 2
+
+
+class CountingListener:
+    def __init__(self):
+        self.snapshots = 0
+
+    def after_transition(self, model: Teavent):
+        self.snapshots += 1
+
+
+@pytest.mark.parametrize("teavent", [{"state": "poll_open"}], indirect=True)
+@pytest.mark.parametrize(
+    "fake_executor", [{"now": datetime(2024, 7, 31, 12, 0)}], indirect=True
+)
+def test_bulk_user_actions(teavent: Teavent, fake_executor: FakeExecutor):
+    listener = CountingListener()
+    manager = TeaventManager(executor=fake_executor, listeners=[listener])
+    manager.handle_teavent(teavent)
+    users = [f"@user{i}" for i in range(30)]
+
+    manager.handle_user_actions("confirm", users, teavent.id, force=True)
+    assert teavent.participant_ids == users
+    assert teavent.version == 2
+    assert listener.snapshots == 2
+
+    # one bad user id fails the whole change
+    with pytest.raises(RuntimeError):
+        manager.handle_user_actions("reject", ["@user1", "@nobody"], teavent.id, True)
+    assert teavent.participant_ids == users
+    assert teavent.version == 2
+
+    manager.handle_user_actions("reject", users[:10], teavent.id, force=True)
+    assert teavent.participant_ids == users[10:]
+    assert listener.snapshots == 3
+
+
+@pytest.mark.parametrize(
+    "fake_executor", [{"now": datetime(2024, 7, 31, 12, 0)}], indirect=True
+)
+def test_bulk_user_actions_before_poll(teavent: Teavent, fake_executor: FakeExecutor):
+    manager = TeaventManager(executor=fake_executor)
+    manager.handle_teavent(teavent)
+    assert teavent.state == "created"
+
+    manager.handle_user_actions("confirm", ["@a", "@b", "@c"], teavent.id, force=True)
+    with pytest.raises(TransitionNotAllowed):
+        manager.handle_user_actions("confirm", ["@d"], teavent.id, force=False)
+
+    # as single rejects, removing is not forced
+    manager.handle_user_actions("reject", ["@a", "@b"], teavent.id, force=False)
+    assert teavent.participant_ids == ["@c"]
+
+
+@pytest.mark.parametrize(
+    "fake_executor", [{"now": datetime(2024, 7, 31, 23, 30)}], indirect=True
+)
+def test_manage_teavents(
+    manager: TeaventManager, teavent: Teavent, recurring_exception: Teavent
+):
+    # the next occurrence (Fri, Aug 2) is moved
+    recurring_exception.start = datetime(2024, 8, 2, 19, 0, tzinfo=teavent.tz)
+    recurring_exception.end = datetime(2024, 8, 2, 21, 0, tzinfo=teavent.tz)
+    reimported = teavent.model_copy(deep=True)
+
+    # the series goes first, but is adjusted against the exception of the batch
+    results = manager.manage_teavents([teavent, recurring_exception, teavent])
+    assert [(r.id, r.status) for r in results] == [
+        (teavent.id, "managed"),
+        (recurring_exception.id, "managed"),
+    ]
+    assert teavent.start == datetime(2024, 8, 5, 21, 0, tzinfo=teavent.tz)
+
+    manager.handle_user_action("confirm", "@alice", teavent.id, force=True)
+
+    results = manager.manage_teavents([reimported])
+    assert results[0].status == "skipped"
+    assert manager.get_teavent(teavent.id) is teavent
+
+    reimported.summary = "Renamed"
+    results = manager.manage_teavents([reimported], upsert=True)
+    assert results[0].status == "updated"
+    assert manager.get_teavent(teavent.id) is reimported
+    assert reimported.participant_ids == ["@alice"]
+    assert reimported.start == teavent.start
+    assert reimported.version > teavent.version
@@ -0,0 +1,118 @@
+import asyncio
+from contextlib import suppress
+from types import SimpleNamespace
+
+import pytest
+
+from common.executors import HeapExecutor
+from common.flow import TeaventFlow
+from common.models import Teavent
+from common.updates import TeaventUpdate, patch
+from eventmanager.protocol import RmqProtocol
+
+
+class FakeExchange:
+    def __init__(self):
+        self.published: list[TeaventUpdate] = []
+        self.fail_next = False
+
+    async def publish(self, message, routing_key):
+        await asyncio.sleep(0)
+        if self.fail_next:
+            self.fail_next = False
+            raise ConnectionError("channel closed")
+        self.published.append(TeaventUpdate.from_message(message))
+
+    def replay(self) -> list[Teavent]:
+        """Teavents as a consumer rebuilds them from updates"""
+        teavents = []
+        for update in self.published:
+            if update.is_delta:
+                assert teavents[-1].version == update.base_version
+                teavents.append(patch(teavents[-1], update.ops()))
+            else:
+                teavents.append(update.teavent())
+        return teavents
+
+
+@pytest.fixture
+def exchange():
+    return FakeExchange()
+
+
+@pytest.fixture
+def protocol(exchange: FakeExchange):
+    executor = HeapExecutor()
+    yield RmqProtocol(
+        SimpleNamespace(name="outgoing_updates"),
+        SimpleNamespace(default_exchange=exchange),
+        executor=executor,
+        retry_delay=0.01,
+        snapshot_every=3,
+    )
+
+    with suppress(KeyError):  # drains may be done already
+        executor.cancel("rmq_protocol")
+
+
+def _transition(protocol: RmqProtocol, teavent: Teavent, state=TeaventFlow.poll_open):
+    teavent.version += 1
+    protocol.after_transition(state, teavent)
+
+
+async def test_publish_in_transition_order(
+    protocol: RmqProtocol, exchange: FakeExchange, teavent: Teavent
+):
+    for user_id in ["1", "2", "3"]:
+        teavent.participant_ids.append(user_id)
+        _transition(protocol, teavent)
+
+    await asyncio.sleep(0.01)
+
+    assert [t.participant_ids for t in exchange.replay()] == [
+        ["1"],
+        ["1", "2"],
+        ["1", "2", "3"],
+    ]
+    assert protocol.stats.published == 3
+    assert protocol.backlog()["size"] == 0
+
+
+async def test_deltas_between_snapshots(
+    protocol: RmqProtocol, exchange: FakeExchange, teavent: Teavent
+):
+    for user_id in ["1", "2", "3", "4"]:
+        teavent.participant_ids.append(user_id)
+        _transition(protocol, teavent)
+    teavent.participant_ids.remove("2")
+    _transition(protocol, teavent)
+    _transition(protocol, teavent, state=TeaventFlow.finalized)
+
+    await asyncio.sleep(0.01)
+
+    assert [u.kind for u in exchange.published] == [
+        "snapshot",
+        "delta",
+        "delta",
+        "snapshot",
+        "delta",
+        "snapshot",
+    ]
+    assert exchange.replay()[-2].participant_ids == ["1", "3", "4"]
+
+
+async def test_failed_batch_is_retried_in_order(
+    protocol: RmqProtocol, exchange: FakeExchange, teavent: Teavent
+):
+    exchange.fail_next = True
+
+    for state in ["poll_open", "planned"]:
+        teavent.state = state
+        _transition(protocol, teavent)
+
+    await asyncio.sleep(0.05)
+
+    # "planned" of the failed batch may land twice, but never before "poll_open"
+    versions = [u.version for u in exchange.published]
+    assert versions[-2:] == [1, 2]
+    assert protocol.stats.failed == 2
@@ -0,0 +1,64 @@
+from datetime import datetime, timezone
+
+import pytest
+from pymongo import DeleteOne, ReplaceOne
+
+from common.executors import HeapExecutor
+from eventmanager.tasks_db import TasksDB
+
+AT = datetime(2024, 7, 31, 18, 0, tzinfo=timezone.utc)
+
+
+class FakeCollection:
+    def __init__(self):
+        self.writes = []
+
+    async def bulk_write(self, operations, ordered):
+        self.writes.append(operations)
+
+
+@pytest.fixture
+def storage():
+    return FakeCollection()
+
+
+@pytest.fixture
+def tasks_db(storage: FakeCollection):
+    executor = HeapExecutor()
+    yield TasksDB(storage, executor=executor, flush_interval=60)
+
+    # drop not yet fired flushes
+    executor.cancel("tasks_db")
+
+
+async def test_latest_task_of_a_group_is_written(
+    tasks_db: TasksDB, storage: FakeCollection
+):
+    tasks_db.record("t1", "start_poll", AT)
+    tasks_db.record("t1", "stop_poll", AT)
+    tasks_db.record("t2", "start_", AT)
+
+    await tasks_db.flush()
+
+    assert storage.writes == [
+        [
+            ReplaceOne(
+                {"_id": "t1"}, {"name": "stop_poll", "at": AT.isoformat()}, upsert=True
+            ),
+            ReplaceOne(
+                {"_id": "t2"}, {"name": "start_", "at": AT.isoformat()}, upsert=True
+            ),
+        ]
+    ]
+
+
+async def test_discard_supersedes_pending_record(
+    tasks_db: TasksDB, storage: FakeCollection
+):
+    tasks_db.record("t1", "end", AT)
+    tasks_db.discard("t1")
+    tasks_db.discard("t1")
+
+    await tasks_db.flush()
+
+    assert storage.writes == [[DeleteOne({"_id": "t1"})]]
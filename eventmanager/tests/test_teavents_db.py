@@ -0,0 +1,103 @@
+import asyncio
+import os
+import signal
+from types import SimpleNamespace
+
+import pytest
+from pymongo import DeleteOne, ReplaceOne
+
+from common.executors import HeapExecutor
+from common.flow import TeaventFlow
+from common.models import Teavent
+from eventmanager.__main__ import serve
+from eventmanager.protocol import RmqProtocol
+from eventmanager.tasks_db import TasksDB
+from eventmanager.teavents_db import TeaventsDB
+
+
+class FakeCollection:
+    def __init__(self):
+        self.writes = []
+
+    async def bulk_write(self, operations, ordered):
+        self.writes.append(operations)
+
+
+@pytest.fixture
+def storage():
+    return FakeCollection()
+
+
+@pytest.fixture
+def teavents_db(storage: FakeCollection):
+    executor = HeapExecutor()
+    yield TeaventsDB(storage, executor=executor, flush_interval=60)
+
+    # drop not yet fired flushes
+    executor.cancel("teavents_db")
+
+
+async def test_coalesce_writes(
+    teavents_db: TeaventsDB, storage: FakeCollection, teavent: Teavent
+):
+    for user_id in ["1", "2", "3"]:
+        teavent.participant_ids.append(user_id)
+        teavent.version += 1  # as the manager does on every transition
+        teavents_db.after_transition(TeaventFlow.poll_open, teavent)
+
+    await teavents_db.flush()
+
+    document = teavent.model_dump(mode="json", by_alias=True)
+    assert document["participant_ids"] == ["1", "2", "3"]
+    assert storage.writes == [[ReplaceOne({"_id": teavent.id}, document, upsert=True)]]
+
+
+async def test_drop_supersedes_pending_write(
+    teavents_db: TeaventsDB, storage: FakeCollection, teavent: Teavent
+):
+    teavents_db.after_transition(TeaventFlow.ended, teavent)
+    teavents_db.on_enter_finalized(teavent)
+
+    await teavents_db.flush()
+
+    assert storage.writes == [[DeleteOne({"_id": teavent.id})]]
+
+
+async def test_pending_writes_survive_sigterm(
+    teavents_db: TeaventsDB, storage: FakeCollection, teavent: Teavent
+):
+    published = []
+
+    async def publish(message, routing_key):
+        published.append(message)
+
+    executor = HeapExecutor()
+    protocol = RmqProtocol(
+        SimpleNamespace(name="outgoing_updates"),
+        SimpleNamespace(default_exchange=SimpleNamespace(publish=publish)),
+        executor=executor,
+    )
+
+    journal = FakeCollection()
+    tasks_db = TasksDB(journal, executor=executor, flush_interval=60)
+
+    teavent.version += 1
+    teavents_db.after_transition(TeaventFlow.poll_open, teavent)
+    tasks_db.record(teavent.id, "start_", teavent.start)
+    protocol.after_transition(TeaventFlow.poll_open, teavent)
+    # as if the drain and the journal flush did not run yet
+    executor.cancel("rmq_protocol")
+    executor.cancel("tasks_db")
+
+    served = asyncio.create_task(serve(teavents_db, tasks_db, protocol))
+    await asyncio.sleep(0)
+    os.kill(os.getpid(), signal.SIGTERM)
+
+    with pytest.raises(asyncio.CancelledError):
+        await served
+
+    assert storage.writes == [
+        [ReplaceOne({"_id": teavent.id}, teavent.snapshot().document, upsert=True)]
+    ]
+    assert len(journal.writes) == 1
+    assert len(published) == 1
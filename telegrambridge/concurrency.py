@@ -0,0 +1,51 @@
+import asyncio
+from collections.abc import AsyncIterator, Awaitable, Callable, Hashable, Iterable
+from contextlib import asynccontextmanager
+from typing import TypeVar
+
+from attr import define, field
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+@define
+class KeyedLock:
+    """Striped asyncio locks: one per key, dropped once nobody holds or awaits it"""
+
+    _locks: dict[Hashable, asyncio.Lock] = field(factory=dict)
+    _users: dict[Hashable, int] = field(factory=dict)
+
+    @asynccontextmanager
+    async def acquire(self, key: Hashable) -> AsyncIterator[None]:
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        self._users[key] = self._users.get(key, 0) + 1
+
+        try:
+            async with lock:
+                yield
+        finally:
+            self._users[key] -= 1
+            if not self._users[key]:
+                del self._users[key]
+                del self._locks[key]
+
+    def __len__(self) -> int:
+        return len(self._locks)
+
+
+async def fan_out(
+    fn: Callable[[T], Awaitable[R]], items: Iterable[T], limit: int
+) -> list[R | Exception]:
+    """Runs `fn` for every item, at most `limit` at once
+
+    Results are in order of items; failures are returned instead of raised,
+    so one failed item does not abort the others.
+    """
+    semaphore = asyncio.Semaphore(limit)
+
+    async def run(item: T) -> R:
+        async with semaphore:
+            return await fn(item)
+
+    return await asyncio.gather(*(run(item) for item in items), return_exceptions=True)
@@ -0,0 +1,138 @@
+import asyncio
+import logging
+from collections import deque
+from collections.abc import Awaitable, Callable
+
+from aio_pika.abc import AbstractIncomingMessage
+from attr import define, field
+
+from common.flow import TeaventFlow
+from common.models import Teavent
+from common.updates import TeaventUpdate
+from telegrambridge.replica import TeaventsReplica
+
+log = logging.getLogger(__name__)
+
+PREFETCH = 64
+
+
+@define
+class ConsumerStats:
+    handled: int = 0
+    superseded: int = 0
+    failed: int = 0
+
+
+@define
+class _Received:
+    update: TeaventUpdate
+    teavent: Teavent | None  # None until resolved after a version gap
+    message: AbstractIncomingMessage
+
+
+@define(eq=False)
+class UpdatesConsumer:
+    """Feeds `outgoing_updates` to a handler with manual acks
+
+    Updates are decoded onto the replica as soon as they arrive; a delta
+    that does not follow the local version is resolved later by fetching
+    a snapshot. Updates of the same teavent are handled one by one in order,
+    different teavents concurrently. A message is acked after its handler
+    finishes; on failure it is requeued once and then dropped. Updates
+    followed by a queued one or not newer than an already handled version of
+    the same teavent are acked without handling; versions are compared with
+    the publisher's boot epoch first, so updates after an eventmanager restart
+    are never taken for stale ones. In-flight messages are capped by the
+    channel prefetch.
+    """
+
+    _handle: Callable[[Teavent], Awaitable]
+    _replica: TeaventsReplica
+
+    _lanes: dict[str, deque[_Received]] = field(factory=dict)
+    _drains: dict[str, asyncio.Task] = field(factory=dict)
+    _handled_versions: dict[str, tuple[int, int]] = field(factory=dict)
+
+    stats: ConsumerStats = field(factory=ConsumerStats)
+
+    async def __call__(self, message: AbstractIncomingMessage):
+        try:
+            update = TeaventUpdate.from_message(message)
+            teavent = self._replica.apply_update(update)
+        except Exception:
+            # never handled, would hold a prefetch slot forever if left unacked
+            log.exception(f"Drop malformed update {message.message_id}")
+            await message.reject()
+            return
+
+        lane = self._lanes.setdefault(update.teavent_id, deque())
+        lane.append(_Received(update, teavent, message))
+        if update.teavent_id not in self._drains:
+            self._drains[update.teavent_id] = asyncio.create_task(
+                self._drain(update.teavent_id)
+            )
+
+    def in_flight(self) -> int:
+        return sum(map(len, self._lanes.values())) + len(self._drains)
+
+    async def _drain(self, teavent_id: str):
+        lane = self._lanes[teavent_id]
+
+        try:
+            while lane:
+                received = lane.popleft()
+                update, message = received.update, received.message
+
+                handled = self._handled_versions.get(teavent_id, (-1, -1))
+                if lane or update.order <= handled:
+                    self.stats.superseded += 1
+                    await self._settle(message)
+                    continue
+
+                try:
+                    teavent = received.teavent or await self._resolve(update)
+                    await self._handle(teavent)
+                except Exception:
+                    self.stats.failed += 1
+                    # requeue once, a message failing again is poison
+                    requeue = not message.redelivered
+                    log.exception(
+                        f"Failed to handle update of teavent {teavent_id} "
+                        f"v{update.version}, {'requeue' if requeue else 'drop'} it"
+                    )
+                    await self._settle(message, requeue)
+                    continue
+
+                self.stats.handled += 1
+                if teavent.state == TeaventFlow.finalized.value:
+                    self._handled_versions.pop(teavent_id, None)
+                else:
+                    self._handled_versions[teavent_id] = (
+                        update.epoch,
+                        teavent.version,
+                    )
+                await self._settle(message)
+        finally:
+            del self._drains[teavent_id]
+            if not lane:
+                del self._lanes[teavent_id]
+
+    async def _settle(
+        self, message: AbstractIncomingMessage, requeue: bool | None = None
+    ):
+        """Ack, or nack with `requeue`; a failure must not stop the lane"""
+        try:
+            if requeue is None:
+                await message.ack()
+            else:
+                await message.nack(requeue=requeue)
+        except Exception:
+            # the broker redelivers unsettled messages of a closed channel
+            log.exception(f"Failed to settle update {message.message_id}")
+
+    async def _resolve(self, update: TeaventUpdate) -> Teavent:
+        """Teavent at least as new as the update, after a version gap"""
+        log.info(f"Version gap on teavent {update.teavent_id}")
+        return await self._replica.get_teavent(
+            id=update.teavent_id, min_version=update.version, min_epoch=update.epoch
+        )
@@ -1,4 +1,5 @@
 import base64
+from collections import Counter
 from collections.abc import Coroutine
 import logging
 import operator
@@ -8,7 +9,7 @@ import traceback
 from decorator import decorator
 from aiogram.filters.state import StatesGroup, State
 from aiogram.utils.formatting import Code, Bold, Underline, Italic
-from aiogram.types import CallbackQuery, Message
+from aiogram.types import CallbackQuery, Chat, Message
 from aiogram_dialog import Dialog, DialogManager, Window
 from aiogram_dialog.widgets.text import Const, Format
 from aiogram_dialog.widgets.kbd import (
@@ -27,7 +28,8 @@ from aiogram_dialog.widgets.kbd import (
 from aiogram_dialog.widgets.input import TextInput
 
 from common.errors import EventDescriptionParsingError
-from common.models import Teavent
+from common.models import ImportResult, Teavent, TeaventsPage
+from common.rpc import Reply, RpcError, UserActions
 from telegrambridge.views import render_teavent
 
 log = logging.getLogger(__name__)
@@ -44,6 +46,11 @@ async def close_on_error(func, *args, **kwargs):
         await manager.done(e)
 
 
+def _raise_first_error(replies: list[Reply]):
+    for reply in replies:
+        reply.unwrap()
+
+
 def _settings_header() -> str:
     return Underline(Bold("⚙️ НАСТРОЙКИ")).as_html()
 
@@ -56,19 +63,42 @@ class TeaventAdmin(StatesGroup):
     kick_participants = State()
 
 
+TEAVENTS_PAGE_SIZE = 10
+
+# a whole calendar is imported in one call
+IMPORT_TIMEOUT = 60.0  # seconds
+
+
 async def get_teavents_list(
-    list_teavents: Coroutine,
+    query_teavents: Coroutine,
     dialog_manager: DialogManager,
+    event_chat: Chat,
     **_,
 ) -> dict:
-    teavents = await list_teavents()
-    dialog_manager.dialog_data["id_map"] = [t.id for t in teavents]
+    cursors = dialog_manager.dialog_data.setdefault("cursors", [None])
+    page: TeaventsPage = await query_teavents(
+        chat_id=None if event_chat.type == "private" else str(event_chat.id),
+        cursor=cursors[-1],
+        limit=TEAVENTS_PAGE_SIZE,
+    )
+    dialog_manager.dialog_data["next_cursor"] = page.next_cursor
+    dialog_manager.dialog_data["id_map"] = [t.id for t in page.teavents]
     return {
-        "teavents": list(enumerate(teavents)),
-        "count": len(teavents),
+        "teavents": list(enumerate(page.teavents)),
+        "count": len(page.teavents),
+        "has_next": page.next_cursor is not None,
+        "has_prev": len(cursors) > 1,
     }
 
 
+async def on_next_page(callback: CallbackQuery, button: Button, manager: DialogManager):
+    manager.dialog_data["cursors"].append(manager.dialog_data["next_cursor"])
+
+
+async def on_prev_page(callback: CallbackQuery, button: Button, manager: DialogManager):
+    manager.dialog_data["cursors"].pop()
+
+
 async def get_teavent_html(
     get_teavent: Coroutine,
     dialog_manager: DialogManager,
@@ -108,6 +138,20 @@ def select_teavent() -> Window:
                 on_click=on_teavent_selected,
             ),
         ),
+        Row(
+            Button(
+                Const("⬅️"),
+                id="select_teavents.prev",
+                on_click=on_prev_page,
+                when="has_prev",
+            ),
+            Button(
+                Const("➡️"),
+                id="select_teavents.next",
+                on_click=on_next_page,
+                when="has_next",
+            ),
+        ),
         Cancel(Const("❌ Закрыть")),  # TODO check show mode
         getter=get_teavents_list,
         state=TeaventAdmin.select_teavent,
@@ -195,16 +239,20 @@ async def do_add(
     manager: DialogManager,
     data: str,
 ):
-    user_action = manager.middleware_data["user_action"]
+    batch = manager.middleware_data["batch"]
     teavent_id = manager.dialog_data["selected_teavent_id"]
 
-    for user_id in (s for s in map(str.strip, data.split(",")) if s):
-        await user_action(
-            type="confirm",
-            user_id=user_id,
-            teavent_id=teavent_id,
-            force=True,
-        )
+    user_ids = [s for s in map(str.strip, data.split(",")) if s]
+
+    # all or nothing, one update of the teavent message
+    replies = await batch(
+        [
+            UserActions(
+                type="confirm", user_ids=user_ids, teavent_id=teavent_id, force=True
+            )
+        ]
+    )
+    _raise_first_error(replies)
 
     await message.delete()
     await manager.switch_to(TeaventAdmin.teavent_settings)
@@ -257,16 +305,20 @@ async def get_partcipants(
 
 
 async def _do_kick(manager: DialogManager, participant_ids: list[str]):
-    user_action = manager.middleware_data["user_action"]
+    batch = manager.middleware_data["batch"]
     teavent_id = manager.dialog_data["selected_teavent_id"]
 
-    for participant_id in participant_ids:
-        await user_action(
-            type="reject",
-            user_id=participant_id,
-            teavent_id=teavent_id,
-            force=True,
-        )
+    replies = await batch(
+        [
+            UserActions(
+                type="reject",
+                user_ids=participant_ids,
+                teavent_id=teavent_id,
+                force=True,
+            )
+        ]
+    )
+    _raise_first_error(replies)
 
 
 @close_on_error
@@ -480,16 +532,35 @@ async def start_managing_teavents(
 
     communication_ids = [str(callback.message.chat.id)]
 
-    manage_teavent = manager.middleware_data["manage_teavent"]
+    manage_teavents = manager.middleware_data["manage_teavents"]
 
-    for teavent_json in manager.dialog_data["teavents"]:
-        try:
-            teavent = Teavent.model_validate_json(teavent_json)
-            teavent.communication_ids = communication_ids
-            await manage_teavent(teavent=teavent)
-        except Exception as e:
-            await manager.done(e)
+    teavents = [
+        Teavent.model_validate_json(teavent_json)
+        for teavent_json in manager.dialog_data["teavents"]
+    ]
+    for teavent in teavents:
+        teavent.communication_ids = communication_ids
 
+    try:
+        results: list[ImportResult] = await manage_teavents(
+            teavents=teavents, timeout=IMPORT_TIMEOUT
+        )
+    except RpcError as e:
+        log.exception(f"Failed to import {len(teavents)} teavents")
+        await callback.message.answer(f"Не удалось добавить события: {e}")
+        return await manager.done(e)
+
+    counts = Counter(r.status for r in results)
+    for r in results:
+        if r.status == "failed":
+            log.warning(f"Failed to manage teavent {r.id}: {r.error}")
+
+    await callback.message.answer(
+        f"Добавлено: {counts['managed']}, "
+        f"обновлено: {counts['updated']}, "
+        f"уже были: {counts['skipped']}, "
+        f"ошибок: {counts['failed']}"
+    )
     await manager.done()
 
 
@@ -0,0 +1,82 @@
+"""Stand-in for the Telegram Bot API to run telegrambridge offline
+
+    python -m telegrambridge.fake_api --port 8081
+    TELEGRAM_API=http://localhost:8081 python -m telegrambridge
+
+Every method succeeds with a minimal result; calls are counted per method.
+"""
+
+import argparse
+import asyncio
+import itertools
+import logging
+import time
+from collections import Counter
+
+from aiohttp import web
+from attr import define, field
+
+log = logging.getLogger(__name__)
+
+BOT_USER = {"id": 1, "is_bot": True, "first_name": "teave", "username": "teave_bot"}
+
+
+@define
+class FakeBotAPI:
+    _latency: float = 0.0
+
+    calls: Counter = field(factory=Counter)
+    _message_ids: itertools.count = field(factory=lambda: itertools.count(1))
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post("/bot{token}/{method}", self._handle)
+        app.router.add_get("/stats", self._stats)
+        return app
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        params = await request.post()
+        self.calls[method] += 1
+
+        if self._latency:
+            await asyncio.sleep(self._latency)
+
+        return web.json_response({"ok": True, "result": self._result(method, params)})
+
+    async def _stats(self, request: web.Request) -> web.Response:
+        return web.json_response(dict(self.calls))
+
+    def _result(self, method: str, params):
+        match method:
+            case "getMe":
+                return BOT_USER
+            case "getUpdates":
+                return []
+            case "getChatAdministrators":
+                return []
+            case "sendMessage":
+                return {
+                    "message_id": next(self._message_ids),
+                    "date": int(time.time()),
+                    "chat": {"id": int(params["chat_id"]), "type": "supergroup"},
+                    "from": BOT_USER,
+                    "text": params.get("text", ""),
+                }
+            case _:
+                return True
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--latency", type=float, default=0.0)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    web.run_app(FakeBotAPI(latency=args.latency).app(), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
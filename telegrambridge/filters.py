@@ -1,4 +1,91 @@
+import asyncio
+
 import aiogram
+from attr import define, field
+import motor.motor_asyncio as aio_mongo
+
+ADMINS_TTL = 300
+STAMP_TTL = 5
+
+
+@define
+class _AdminsEntry:
+    fetch: asyncio.Future
+    stamp: int = 0
+    stamp_checked_at: float = 0.0
+    expires_at: float = float("inf")  # set once fetched
+
+
+@define
+class AdminsCache:
+    """Chat administrators per chat with TTL; concurrent lookups share one call
+
+    With several bot workers only one of them gets a chat_member update, so
+    invalidations bump a per-chat stamp in `stamps` that every worker checks
+    at most once per `stamp_ttl`.
+    """
+
+    _ttl: float = ADMINS_TTL
+    _stamp_ttl: float = STAMP_TTL
+    _stamps: aio_mongo.AsyncIOMotorCollection | None = None
+    _chats: dict[int, _AdminsEntry] = field(factory=dict)
+
+    def share_invalidations(self, stamps: aio_mongo.AsyncIOMotorCollection):
+        self._stamps = stamps
+
+    async def get(self, bot: aiogram.Bot, chat_id: int) -> set[int]:
+        loop = asyncio.get_running_loop()
+
+        entry = self._chats.get(chat_id)
+        if entry is None or not await self._is_current(entry, chat_id, loop.time()):
+            stamp = await self._stamp(chat_id)
+            entry = self._chats[chat_id] = _AdminsEntry(
+                asyncio.ensure_future(self._fetch(bot, chat_id)),
+                stamp,
+                stamp_checked_at=loop.time(),
+            )
+
+        try:
+            admin_ids = await asyncio.shield(entry.fetch)
+        except Exception:
+            if self._chats.get(chat_id) is entry:
+                del self._chats[chat_id]
+            raise
+
+        if entry.expires_at == float("inf"):
+            entry.expires_at = loop.time() + self._ttl
+        return admin_ids
+
+    async def invalidate(self, chat_id: int):
+        if self._stamps is not None:
+            await self._stamps.update_one(
+                {"_id": chat_id}, {"$inc": {"stamp": 1}}, upsert=True
+            )
+        self._chats.pop(chat_id, None)
+
+    async def _is_current(self, entry: _AdminsEntry, chat_id: int, now: float) -> bool:
+        if entry.expires_at <= now:
+            return False
+
+        if self._stamps is None or now < entry.stamp_checked_at + self._stamp_ttl:
+            return True
+
+        # set before the read, so concurrent lookups do not repeat it
+        entry.stamp_checked_at = now
+        return entry.stamp == await self._stamp(chat_id)
+
+    async def _stamp(self, chat_id: int) -> int:
+        if self._stamps is None:
+            return 0
+        document = await self._stamps.find_one({"_id": chat_id})
+        return document["stamp"] if document else 0
+
+    async def _fetch(self, bot: aiogram.Bot, chat_id: int) -> set[int]:
+        chat_admins = await bot.get_chat_administrators(chat_id=chat_id)
+        return {admin.user.id for admin in chat_admins}
+
+
+admins_cache = AdminsCache()
 
 
 class IsAdmin(aiogram.filters.BaseFilter):
@@ -8,5 +95,4 @@ class IsAdmin(aiogram.filters.BaseFilter):
         if message.from_user.id in self.SUPERADMINS:
             return True
 
-        chat_admins = await bot.get_chat_administrators(chat_id=message.chat.id)
-        return any(admin.user.id == message.from_user.id for admin in chat_admins)
+        return message.from_user.id in await admins_cache.get(bot, message.chat.id)
@@ -7,13 +7,16 @@ from aiogram import F
 from aiogram.types import ReactionTypeEmoji
 from aiogram.filters import Command, CommandStart
 from aiogram.filters.command import CommandObject
+from aiogram.utils.formatting import as_key_value, as_list
 from aiogram_dialog import DialogManager, ShowMode, StartMode
 
 from common.flow import TeaventFlow
+from common.rpc import RpcError
 from telegrambridge.dialogs import ManageNewTeavents, TeaventAdmin
-from telegrambridge.filters import IsAdmin
+from telegrambridge.filters import IsAdmin, admins_cache
 from telegrambridge.keyboards import IAmLateAction, PlannedPollAction, RegPollAction
-from telegrambridge.views import TeaventPresenter, render_teavents
+from telegrambridge.outbox import TelegramOutbox
+from telegrambridge.views import TeaventPresenter, render_tasks, render_teavents
 
 
 log = logging.getLogger(__name__)
@@ -21,6 +24,8 @@ router = aiogram.Router()
 
 deep_link = re.compile(r"(.*)_(.*)")
 
+TASKS_USAGE = "/tasks [group_prefix] [offset]"
+
 
 @router.message(
     CommandStart(deep_link=True, magic=F.args.regexp(deep_link).as_("match"))
@@ -89,15 +94,66 @@ async def handle_view(
 
 
 @router.message(Command("tasks"), IsAdmin())
-async def handle_tasks(message: aiogram.types.Message, tasks: Coroutine):
-    await message.reply(str(await tasks()))
+async def handle_tasks(
+    message: aiogram.types.Message,
+    command: CommandObject,
+    tasks: Coroutine,
+):
+    args = (command.args or "").split()
+    group_prefix = args[0] if args else None
+    offset = args[1] if len(args) > 1 else "0"
+    if len(args) > 2 or not offset.isdecimal():
+        await message.reply(text=TASKS_USAGE)
+        return
+
+    content = render_tasks(await tasks(group_prefix=group_prefix, offset=int(offset)))
+    await message.reply(**content.as_kwargs())
+
+
+@router.message(Command("outbox"), IsAdmin())
+async def handle_outbox(message: aiogram.types.Message, outbox: TelegramOutbox):
+    stats = outbox.stats
+    content = as_list(
+        *(as_key_value(lane, depth) for lane, depth in outbox.queue_depth().items()),
+        as_key_value("granted", stats.granted),
+        as_key_value("retries", stats.retries),
+        as_key_value("avg wait", f"{stats.avg_wait:.3f}s"),
+        as_key_value("max wait", f"{stats.max_wait:.3f}s"),
+    )
+    await message.reply(**content.as_kwargs())
+
+
+@router.message(Command("publish"), IsAdmin())
+async def handle_publish(message: aiogram.types.Message, publish_stats: Coroutine):
+    stats = await publish_stats()
+    content = as_list(
+        as_key_value("published", stats["published"]),
+        as_key_value("failed", stats["failed"]),
+        as_key_value("batches", stats["batches"]),
+        as_key_value("backlog", stats["backlog"]["size"]),
+        as_key_value("oldest", f"{stats['backlog']['oldest_age']:.3f}s"),
+        as_key_value("avg latency", f"{stats['avg_latency']:.3f}s"),
+        as_key_value("max latency", f"{stats['max_latency']:.3f}s"),
+    )
+    await message.reply(**content.as_kwargs())
 
 
 @router.message(Command("teavents"), IsAdmin())
 async def handle_command_teavents(
-    message: aiogram.types.Message, list_teavents: Coroutine
+    message: aiogram.types.Message,
+    command: CommandObject,
+    query_teavents: Coroutine,
 ):
-    content = render_teavents(await list_teavents())
+    # /teavents [cursor], the cursor of the next page is shown under the list
+    try:
+        page = await query_teavents(
+            chat_id=_chat_filter(message.chat), cursor=command.args
+        )
+    except RpcError as e:
+        await message.reply(text=str(e))
+        return
+
+    content = render_teavents(page.teavents, page.next_cursor)
     await message.reply(
         **content.as_kwargs(),
         disable_web_page_preview=True,
@@ -105,6 +161,11 @@ async def handle_command_teavents(
     )
 
 
+def _chat_filter(chat: aiogram.types.Chat) -> str | None:
+    # private chat with the bot shows teavents of all chats
+    return None if chat.type == "private" else str(chat.id)
+
+
 @router.message(Command("new"), IsAdmin())
 async def handle_command_new(
     message: aiogram.types.Message,
@@ -177,3 +238,10 @@ async def handle_view_action(
         return await callback.answer(str(e), show_alert=True)
 
     return await callback.answer()
+
+
+@router.chat_member()
+@router.my_chat_member()
+async def handle_chat_member_update(update: aiogram.types.ChatMemberUpdated):
+    # promotions and demotions must apply before the cache expires
+    await admins_cache.invalidate(update.chat.id)
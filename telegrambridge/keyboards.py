@@ -1,14 +1,19 @@
+from functools import lru_cache
+
 from aiogram.filters.callback_data import CallbackData
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 
 # TODO: TeaventAction base class
 
+# keyboards depend only on teavent id, so they are built once per teavent
+
 
 class RegPollAction(CallbackData, prefix="reg_poll"):
     action: str
     teavent_id: str
 
 
+@lru_cache(maxsize=1024)
 def make_regpoll_keyboard(teavent_id: str):
     builder = InlineKeyboardBuilder()
     builder.button(
@@ -28,6 +33,7 @@ class PlannedPollAction(CallbackData, prefix="planned_poll"):
     teavent_id: str
 
 
+@lru_cache(maxsize=1024)
 def make_plannedpoll_keyboard(teavent_id: str):
     builder = InlineKeyboardBuilder()
     builder.button(
@@ -47,6 +53,7 @@ class IAmLateAction(CallbackData, prefix="i_am_late"):
     action: str
 
 
+@lru_cache(maxsize=1024)
 def make_started_keyboard(teavent_id: str):
     builder = InlineKeyboardBuilder()
     builder.button(
@@ -1,11 +1,21 @@
+import asyncio
 import json
+import logging
 import datetime
+from collections.abc import Awaitable, Callable, Iterable
 from datetime import datetime
 
-from attr import define
+from attr import define, field
 import aiogram
 from aiogoogle import GoogleAPI, Aiogoogle
 from aiogoogle.auth.creds import ServiceAccountCreds
+import motor.motor_asyncio as aio_mongo
+from pymongo.errors import DuplicateKeyError
+
+from common.models import Teavent
+from common.rpc import Reply, Request, UserAction, UserActions
+
+log = logging.getLogger(__name__)
 
 
 def init_aiogoogle() -> Aiogoogle:
@@ -37,3 +47,95 @@ class CalendarMiddleware(aiogram.BaseMiddleware):
                 timeMin=datetime.utcnow().isoformat() + "Z",
             )
         )
+
+
+@define
+class RequestCache:
+    """Teavent reads memoised for a single update, so all getters of one
+    dialog render share a fetch"""
+
+    _get_teavent: Callable[..., Awaitable[Teavent]]
+    _user_action: Callable[..., Awaitable[Teavent]]
+    _batch: Callable[[Iterable[Request]], Awaitable[list[Reply]]]
+
+    _teavents: dict[str, asyncio.Future] = field(factory=dict)
+
+    async def get_teavent(self, id: str, **kwargs) -> Teavent:
+        fetch = self._teavents.get(id)
+        if fetch is None:
+            fetch = self._teavents[id] = asyncio.ensure_future(
+                self._get_teavent(id=id, **kwargs)
+            )
+
+        try:
+            return await asyncio.shield(fetch)
+        except Exception:
+            # do not memoise failures
+            if self._teavents.get(id) is fetch:
+                del self._teavents[id]
+            raise
+
+    async def user_action(self, teavent_id: str, **kwargs) -> Teavent:
+        self._teavents.pop(teavent_id, None)
+
+        teavent = await self._user_action(teavent_id=teavent_id, **kwargs)
+        self._remember(teavent)
+        return teavent
+
+    async def batch(self, requests: Iterable[Request]) -> list[Reply]:
+        requests = list(requests)
+        for request in requests:
+            if isinstance(request, (UserAction, UserActions)):
+                self._teavents.pop(request.teavent_id, None)
+
+        replies = await self._batch(requests)
+
+        for request, reply in zip(requests, replies):
+            if isinstance(request, (UserAction, UserActions)) and reply.ok:
+                self._remember(reply.result)
+
+        return replies
+
+    def _remember(self, teavent: Teavent):
+        fetched = asyncio.get_running_loop().create_future()
+        fetched.set_result(teavent)
+        self._teavents[teavent.id] = fetched
+
+
+class RequestCacheMiddleware(aiogram.BaseMiddleware):
+    """Wraps `get_teavent`, `user_action` and `batch` with a per-update
+    `RequestCache`"""
+
+    async def __call__(self, handler, event: aiogram.types.Update, data: dict):
+        cache = RequestCache(data["get_teavent"], data["user_action"], data["batch"])
+        data["get_teavent"] = cache.get_teavent
+        data["user_action"] = cache.user_action
+        data["batch"] = cache.batch
+        return await handler(event, data)
+
+
+@define
+class DedupUpdatesMiddleware(aiogram.BaseMiddleware):
+    """Drops updates already taken by any worker
+
+    Telegram redelivers a webhook update if it is not acknowledged in time,
+    and with several workers the retry may land on another process. The
+    first worker to insert `update_id` into the shared collection wins.
+    """
+
+    _updates: aio_mongo.AsyncIOMotorCollection
+
+    async def __call__(self, handler, event: aiogram.types.Update, data: dict):
+        try:
+            await self._updates.insert_one(
+                {"_id": event.update_id, "at": datetime.utcnow()}
+            )
+        except DuplicateKeyError:
+            log.info(f"Skip duplicate update {event.update_id}")
+            return None
+
+        return await handler(event, data)
+
+    async def create_indexes(self, ttl_seconds: int = 24 * 60 * 60):
+        # update_id is unique per bot, old records are only needed for retries
+        await self._updates.create_index("at", expireAfterSeconds=ttl_seconds)
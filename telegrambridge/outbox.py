@@ -0,0 +1,246 @@
+import asyncio
+import enum
+import logging
+from collections import deque
+from contextlib import suppress
+
+import aiogram
+from aiogram.client.session.middlewares.base import (
+    BaseRequestMiddleware,
+    NextRequestMiddlewareType,
+)
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import (
+    AnswerCallbackQuery,
+    DeleteMessage,
+    EditMessageReplyMarkup,
+    EditMessageText,
+    PinChatMessage,
+    TelegramMethod,
+    UnpinChatMessage,
+)
+from attr import define, field
+
+log = logging.getLogger(__name__)
+
+# https://core.telegram.org/bots/faq#my-bot-is-hitting-limits-how-do-i-avoid-this
+GLOBAL_RATE = 30
+CHAT_RATE = 1
+
+
+class Priority(enum.IntEnum):
+    CALLBACK = 0
+    LIVE_EDIT = 1
+    SEND = 2
+    CLEANUP = 3
+
+
+def _priority(method: TelegramMethod) -> Priority:
+    if isinstance(method, AnswerCallbackQuery):
+        return Priority.CALLBACK
+
+    if isinstance(method, EditMessageText):
+        return Priority.LIVE_EDIT
+
+    if isinstance(method, EditMessageReplyMarkup):
+        return Priority.LIVE_EDIT if method.reply_markup else Priority.CLEANUP
+
+    if isinstance(method, (PinChatMessage, UnpinChatMessage, DeleteMessage)):
+        return Priority.CLEANUP
+
+    return Priority.SEND
+
+
+@define
+class TokenBucket:
+    rate: float
+    capacity: float
+
+    tokens: float = field()
+    updated: float = 0.0
+    blocked_until: float = 0.0
+
+    @tokens.default
+    def _full(self):
+        return self.capacity
+
+    def delay(self, now: float) -> float:
+        """Seconds until a token is available"""
+        if now < self.blocked_until:
+            return self.blocked_until - now
+
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self):
+        self.tokens -= 1
+
+    def block(self, now: float, seconds: float):
+        self.blocked_until = max(self.blocked_until, now + seconds)
+        self.tokens = 0
+
+    def is_idle(self, now: float) -> bool:
+        return self.delay(now) == 0 and self.tokens >= self.capacity
+
+
+@define(eq=False)
+class _Waiter:
+    future: asyncio.Future
+    enqueued_at: float
+
+
+@define
+class OutboxStats:
+    granted: int = 0
+    retries: int = 0
+    total_wait: float = 0.0
+    max_wait: float = 0.0
+
+    def record_wait(self, wait: float):
+        self.granted += 1
+        self.total_wait += wait
+        self.max_wait = max(self.max_wait, wait)
+
+    @property
+    def avg_wait(self) -> float:
+        return self.total_wait / self.granted if self.granted else 0.0
+
+
+@define(eq=False)
+class TelegramOutbox(BaseRequestMiddleware):
+    """Request middleware that dispatches every bot call through token buckets
+
+    Calls wait in priority lanes: callback answers and live poll edits go before
+    new messages, pins and markup cleanup. Within a lane calls queue per chat,
+    chats in the order they started waiting. `retry_after` from Telegram blocks
+    the affected bucket and the call is retried.
+    """
+
+    _global_rate: float = GLOBAL_RATE
+    _chat_rate: float = CHAT_RATE
+    _chat_burst: float = 3
+    _max_retries: int = 3
+
+    # per lane: chat -> its waiters, None for calls outside of chats
+    _lanes: list[dict[str | None, deque[_Waiter]]] = field(
+        factory=lambda: [{} for _ in Priority]
+    )
+    _global_bucket: TokenBucket = field()
+    _chats: dict[str, TokenBucket] = field(factory=dict)
+    _wakeup: asyncio.Event = field(factory=asyncio.Event)
+    _pump: asyncio.Task | None = None
+
+    stats: OutboxStats = field(factory=OutboxStats)
+
+    @_global_bucket.default
+    def _make_global_bucket(self):
+        return TokenBucket(rate=self._global_rate, capacity=self._global_rate)
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType,
+        bot: aiogram.Bot,
+        method: TelegramMethod,
+    ):
+        priority = _priority(method)
+        chat_id = getattr(method, "chat_id", None)
+        # the presenter sends communication ids as str, handlers int chat ids
+        chat = str(chat_id) if chat_id is not None else None
+
+        for attempt in range(self._max_retries + 1):
+            await self._acquire(priority, chat)
+
+            try:
+                return await make_request(bot, method)
+            except TelegramRetryAfter as e:
+                if attempt == self._max_retries:
+                    raise
+
+                log.warning(
+                    f"Flood control on {type(method).__name__} to chat {chat_id}, "
+                    f"retry in {e.retry_after}s"
+                )
+                self.stats.retries += 1
+
+                bucket = self._chat_bucket(chat) if chat else self._global_bucket
+                bucket.block(asyncio.get_running_loop().time(), e.retry_after)
+
+    def queue_depth(self) -> dict[str, int]:
+        return {
+            priority.name: sum(map(len, self._lanes[priority].values()))
+            for priority in Priority
+        }
+
+    async def _acquire(self, priority: Priority, chat: str | None):
+        loop = asyncio.get_running_loop()
+        waiter = _Waiter(loop.create_future(), enqueued_at=loop.time())
+        self._lanes[priority].setdefault(chat, deque()).append(waiter)
+
+        if self._pump is None:
+            self._pump = asyncio.create_task(self._run_pump())
+        self._wakeup.set()
+
+        await waiter.future
+        self.stats.record_wait(loop.time() - waiter.enqueued_at)
+
+    async def _run_pump(self):
+        loop = asyncio.get_running_loop()
+
+        try:
+            while any(self._lanes):
+                now = loop.time()
+
+                delay = self._global_bucket.delay(now)
+                if delay == 0:
+                    waiter, chat, delay = self._pick(now)
+                    if waiter is not None:
+                        self._global_bucket.take()
+                        if chat:
+                            self._chat_bucket(chat).take()
+                        waiter.future.set_result(None)
+                        continue
+                    if not any(self._lanes):
+                        break
+
+                self._wakeup.clear()
+                with suppress(asyncio.TimeoutError):
+                    await asyncio.wait_for(self._wakeup.wait(), delay)
+        finally:
+            self._pump = None
+            self._prune_chats(loop.time())
+
+    def _pick(self, now: float) -> tuple[_Waiter | None, str | None, float]:
+        """The first waiter of the highest lane whose chat has a token"""
+        min_delay = float("inf")
+
+        for lane in self._lanes:
+            for chat, waiters in list(lane.items()):
+                while waiters and waiters[0].future.done():  # caller is cancelled
+                    waiters.popleft()
+                if not waiters:
+                    del lane[chat]
+                    continue
+
+                delay = self._chat_bucket(chat).delay(now) if chat else 0
+                if delay == 0:
+                    waiter = waiters.popleft()
+                    if not waiters:
+                        del lane[chat]
+                    return waiter, chat, 0
+                min_delay = min(min_delay, delay)
+
+        return None, None, min_delay
+
+    def _chat_bucket(self, chat: str) -> TokenBucket:
+        bucket = self._chats.get(chat)
+        if bucket is None:
+            bucket = self._chats[chat] = TokenBucket(
+                rate=self._chat_rate, capacity=self._chat_burst
+            )
+        return bucket
+
+    def _prune_chats(self, now: float):
+        for chat in [c for c, b in self._chats.items() if b.is_idle(now)]:
+            del self._chats[chat]
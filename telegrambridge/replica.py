@@ -0,0 +1,144 @@
+import logging
+from collections.abc import Awaitable, Callable, Iterable
+
+from attr import define, field
+
+from common.flow import TeaventFlow
+from common.models import Teavent, TeaventsPage
+from common.rpc import Reply, Request
+from common.updates import TeaventUpdate, patch
+
+log = logging.getLogger(__name__)
+
+MAX_FINALIZED = 10_000
+
+
+@define
+class ReplicaStats:
+    hits: int = 0
+    misses: int = 0
+    applied: int = 0
+    stale: int = 0
+    deltas: int = 0
+    gaps: int = 0
+
+
+@define(eq=False)
+class TeaventsReplica:
+    """Local copy of managed teavents kept current from `outgoing_updates`
+
+    Reads are served locally and fall back to eventmanager RPC on a miss
+    or when the local copy is older than requested. Copies are ordered by
+    `(epoch, version)` of the updates they come with; RPC replies are taken
+    as of the latest epoch seen.
+    """
+
+    _rpc_get_teavent: Callable[..., Awaitable[Teavent]]
+    _rpc_query_teavents: Callable[..., Awaitable[TeaventsPage]]
+    _rpc_user_action: Callable[..., Awaitable[Teavent]]
+    _rpc_batch: Callable[[Iterable[Request]], Awaitable[list[Reply]]]
+
+    _teavents: dict[str, Teavent] = field(factory=dict)
+    _epochs: dict[str, int] = field(factory=dict)
+    # epochs of finalized teavents, never resurrected by late copies of them;
+    # the oldest are forgotten past MAX_FINALIZED
+    _finalized: dict[str, int] = field(factory=dict)
+
+    epoch: int = 0
+    stats: ReplicaStats = field(factory=ReplicaStats)
+
+    def apply(self, teavent: Teavent, epoch: int | None = None) -> bool:
+        """Store the teavent unless the local copy is newer"""
+        if epoch is None:
+            epoch = self.epoch
+        self.epoch = max(self.epoch, epoch)
+
+        finalized_in = self._finalized.get(teavent.id)
+        if finalized_in is not None:
+            if finalized_in >= epoch:
+                return False
+            # eventmanager restarted without the finalization persisted
+            del self._finalized[teavent.id]
+
+        if teavent.state == TeaventFlow.finalized.value:
+            self._finalized[teavent.id] = epoch
+            if len(self._finalized) > MAX_FINALIZED:
+                del self._finalized[next(iter(self._finalized))]
+            self._teavents.pop(teavent.id, None)
+            self._epochs.pop(teavent.id, None)
+            return True
+
+        if self._order(teavent.id) > (epoch, teavent.version):
+            self.stats.stale += 1
+            return False
+
+        self._teavents[teavent.id] = teavent
+        self._epochs[teavent.id] = epoch
+        self.stats.applied += 1
+        return True
+
+    def apply_update(self, update: TeaventUpdate) -> Teavent | None:
+        """Decode an `outgoing_updates` message onto the local copy
+
+        Returns None if a delta does not follow the local version; the caller
+        has to fetch a snapshot then.
+        """
+        if not update.is_delta:
+            teavent = update.teavent()
+            self.apply(teavent, update.epoch)
+            return teavent
+
+        self.epoch = max(self.epoch, update.epoch)
+        if self._order(update.teavent_id) != (update.epoch, update.base_version):
+            self.stats.gaps += 1
+            return None
+
+        teavent = patch(self._teavents[update.teavent_id], update.ops())
+        self._teavents[teavent.id] = teavent
+        self.stats.deltas += 1
+        return teavent
+
+    def peek(self, id: str) -> Teavent | None:
+        return self._teavents.get(id)
+
+    def __len__(self) -> int:
+        return len(self._teavents)
+
+    def _order(self, id: str) -> tuple[int, int]:
+        teavent = self._teavents.get(id)
+        if teavent is None:
+            return (-1, -1)
+        return (self._epochs[id], teavent.version)
+
+    # proxies with the same signatures as RPC
+
+    async def get_teavent(
+        self, id: str, min_version: int = 0, min_epoch: int = 0
+    ) -> Teavent:
+        teavent = self._teavents.get(id)
+        if teavent is not None and self._order(id) >= (min_epoch, min_version):
+            self.stats.hits += 1
+            return teavent
+
+        self.stats.misses += 1
+        teavent = await self._rpc_get_teavent(id=id)
+        self.apply(teavent)
+        return teavent
+
+    async def query_teavents(self, **kwargs) -> TeaventsPage:
+        page: TeaventsPage = await self._rpc_query_teavents(**kwargs)
+        for teavent in page.teavents:
+            self.apply(teavent)
+        return page
+
+    async def user_action(self, **kwargs) -> Teavent:
+        teavent: Teavent = await self._rpc_user_action(**kwargs)
+        self.apply(teavent)
+        return teavent
+
+    async def batch(self, requests: Iterable[Request]) -> list[Reply]:
+        replies = await self._rpc_batch(requests)
+        for reply in replies:
+            if reply.ok and isinstance(reply.result, Teavent):
+                self.apply(reply.result)
+        return replies
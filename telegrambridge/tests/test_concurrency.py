@@ -0,0 +1,63 @@
+import asyncio
+
+from telegrambridge.concurrency import KeyedLock, fan_out
+
+
+async def test_keyed_lock_orders_holders_of_a_key():
+    lock = KeyedLock()
+    events = []
+
+    async def hold(key: str, name: str):
+        async with lock.acquire(key):
+            events.append(f"{name} in")
+            await asyncio.sleep(0)
+            await asyncio.sleep(0)
+            events.append(f"{name} out")
+
+    await asyncio.gather(hold("t1", "a"), hold("t1", "b"), hold("t2", "c"))
+
+    # b waits for a, c holds another key meanwhile
+    assert events.index("a out") < events.index("b in")
+    assert events.index("c in") < events.index("a out")
+    assert len(lock) == 0
+
+
+async def test_keyed_lock_drops_keys_of_cancelled_waiters():
+    lock = KeyedLock()
+
+    async with lock.acquire("t1"):
+        waiter = asyncio.create_task(_enter(lock, "t1"))
+        await asyncio.sleep(0)
+        assert len(lock) == 1
+
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+
+    assert len(lock) == 0
+
+
+async def _enter(lock: KeyedLock, key: str):
+    async with lock.acquire(key):
+        pass
+
+
+async def test_fan_out_returns_failures_in_order():
+    running = 0
+    max_running = 0
+
+    async def call(item: int) -> int:
+        nonlocal running, max_running
+        running += 1
+        max_running = max(max_running, running)
+        await asyncio.sleep(0)
+        running -= 1
+
+        if item == 2:
+            raise RuntimeError("chat is unavailable")
+        return item * 10
+
+    results = await fan_out(call, [1, 2, 3, 4], limit=2)
+
+    assert [results[0], *results[2:]] == [10, 30, 40]
+    assert isinstance(results[1], RuntimeError)
+    assert max_running == 2
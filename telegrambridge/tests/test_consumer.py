@@ -0,0 +1,244 @@
+import asyncio
+
+import pytest
+
+from common import codecs
+from common.models import Teavent
+from common.updates import TeaventUpdate
+from telegrambridge.consumer import UpdatesConsumer
+from telegrambridge.replica import MAX_FINALIZED, TeaventsReplica
+
+
+class FakeMessage:
+    """Incoming `outgoing_updates` message recording its settlement"""
+
+    def __init__(self, update: TeaventUpdate, redelivered: bool = False):
+        message = update.message()
+        self.body = message.body
+        self.headers = message.headers
+        self.content_type = message.content_type
+        self.content_encoding = message.content_encoding
+        self.message_id = None
+        self.redelivered = redelivered
+        self.settled = None
+
+    async def ack(self):
+        self.settled = "ack"
+
+    async def nack(self, requeue: bool = True):
+        self.settled = "requeue" if requeue else "drop"
+
+    async def reject(self, requeue: bool = False):
+        self.settled = "reject"
+
+
+def _version(teavent: Teavent, version: int, **update) -> Teavent:
+    return teavent.model_copy(update={"version": version, **update}, deep=True)
+
+
+def _full(teavent: Teavent, **kwargs) -> FakeMessage:
+    return FakeMessage(TeaventUpdate.full(teavent.snapshot()), **kwargs)
+
+
+class Handler:
+    def __init__(self):
+        self.handled: list[tuple[str, int]] = []
+        self.release = asyncio.Event()
+        self.active = 0
+        self.max_active = 0
+        self.fail = False
+
+    async def __call__(self, teavent: Teavent):
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        try:
+            await self.release.wait()
+            if self.fail:
+                raise RuntimeError("telegram is down")
+            self.handled.append((teavent.id, teavent.version))
+        finally:
+            self.active -= 1
+
+
+@pytest.fixture
+def fetched() -> dict[str, Teavent]:
+    return {}
+
+
+@pytest.fixture
+def replica(fetched: dict[str, Teavent]) -> TeaventsReplica:
+    async def rpc_get_teavent(id: str) -> Teavent:
+        return fetched[id]
+
+    return TeaventsReplica(rpc_get_teavent, None, None, None)
+
+
+@pytest.fixture
+def handler() -> Handler:
+    return Handler()
+
+
+@pytest.fixture
+def consumer(handler: Handler, replica: TeaventsReplica) -> UpdatesConsumer:
+    return UpdatesConsumer(handler, replica=replica)
+
+
+async def _settle(consumer: UpdatesConsumer, handler: Handler):
+    handler.release.set()
+    while consumer.in_flight():
+        await asyncio.sleep(0)
+
+
+async def test_updates_of_a_teavent_are_handled_in_order(
+    consumer: UpdatesConsumer, handler: Handler, teavent: Teavent
+):
+    messages = [_full(_version(teavent, v)) for v in (1, 2, 3)]
+
+    await consumer(messages[0])
+    await asyncio.sleep(0)  # v1 is being handled
+    await consumer(messages[1])
+    await consumer(messages[2])
+    await _settle(consumer, handler)
+
+    # v2 is followed by v3 in the lane and is superseded
+    assert handler.handled == [(teavent.id, 1), (teavent.id, 3)]
+    assert [m.settled for m in messages] == ["ack", "ack", "ack"]
+    assert consumer.stats.superseded == 1
+
+
+async def test_stale_version_is_acked_without_handling(
+    consumer: UpdatesConsumer, handler: Handler, teavent: Teavent
+):
+    await consumer(_full(_version(teavent, 2)))
+    await _settle(consumer, handler)
+
+    late = _full(_version(teavent, 1))
+    await consumer(late)
+    await _settle(consumer, handler)
+
+    assert handler.handled == [(teavent.id, 2)]
+    assert late.settled == "ack"
+
+
+async def test_teavents_are_handled_concurrently(
+    consumer: UpdatesConsumer, handler: Handler, teavent: Teavent
+):
+    await consumer(_full(_version(teavent, 1)))
+    await consumer(_full(_version(teavent, 1, id="other")))
+    await asyncio.sleep(0)
+
+    assert handler.max_active == 2
+    await _settle(consumer, handler)
+    assert len(handler.handled) == 2
+
+
+async def test_failed_update_is_requeued_once(
+    consumer: UpdatesConsumer, handler: Handler, teavent: Teavent
+):
+    handler.fail = True
+
+    first = _full(_version(teavent, 1))
+    await consumer(first)
+    await _settle(consumer, handler)
+
+    again = _full(_version(teavent, 1), redelivered=True)
+    await consumer(again)
+    await _settle(consumer, handler)
+
+    assert (first.settled, again.settled) == ("requeue", "drop")
+    assert consumer.stats.failed == 2
+
+
+async def test_delta_gap_is_resolved_via_rpc(
+    consumer: UpdatesConsumer,
+    handler: Handler,
+    teavent: Teavent,
+    fetched: dict[str, Teavent],
+):
+    v1 = _version(teavent, 1)
+    v2 = _version(teavent, 2, participant_ids=["@alice"])
+    fetched[teavent.id] = v2
+
+    # v1 was never received, the delta has nothing to apply to
+    message = FakeMessage(TeaventUpdate.delta(v1.snapshot(), v2.snapshot()))
+    await consumer(message)
+    await _settle(consumer, handler)
+
+    assert handler.handled == [(teavent.id, 2)]
+    assert message.settled == "ack"
+    assert consumer._replica.stats.gaps == 1
+    assert consumer._replica.peek(teavent.id) == v2
+
+
+@pytest.mark.parametrize(
+    "update",
+    [
+        TeaventUpdate("t", 1, "snapshot", b"{}"),
+        TeaventUpdate("t", 1, "snapshot", b"{}", content_encoding=codecs.DEFLATE),
+        TeaventUpdate("t", 1, "snapshot", b"\xc1", content_type=codecs.MSGPACK),
+    ],
+)
+async def test_malformed_update_is_rejected(
+    consumer: UpdatesConsumer, update: TeaventUpdate
+):
+    message = FakeMessage(update)
+    await consumer(message)
+
+    assert message.settled == "reject"
+
+
+async def test_failed_ack_does_not_stop_the_lane(
+    consumer: UpdatesConsumer, handler: Handler, teavent: Teavent
+):
+    first, second = _full(_version(teavent, 1)), _full(_version(teavent, 2))
+
+    async def closed_channel():
+        raise ConnectionError("channel is closed")
+
+    first.ack = closed_channel
+    await consumer(first)
+    await consumer(second)
+    await _settle(consumer, handler)
+
+    assert handler.handled == [(teavent.id, 2)]
+    assert second.settled == "ack"
+
+
+def test_finalized_ids_are_capped(replica: TeaventsReplica, teavent: Teavent):
+    finalized = _version(teavent, 1, state="finalized")
+    for i in range(MAX_FINALIZED + 1):
+        replica.apply(finalized.model_copy(update={"id": f"t{i}"}))
+
+    assert len(replica._finalized) == MAX_FINALIZED
+    assert "t0" not in replica._finalized
+
+
+async def test_updates_after_eventmanager_restart_are_handled(
+    consumer: UpdatesConsumer, handler: Handler, teavent: Teavent
+):
+    await consumer(FakeMessage(TeaventUpdate.full(_version(teavent, 5).snapshot(), 1)))
+    await _settle(consumer, handler)
+
+    # the crash lost the last versions, the new boot counts them again
+    restarted = FakeMessage(TeaventUpdate.full(_version(teavent, 3).snapshot(), 2))
+    await consumer(restarted)
+    await _settle(consumer, handler)
+
+    assert handler.handled == [(teavent.id, 5), (teavent.id, 3)]
+    assert restarted.settled == "ack"
+    assert consumer._replica.peek(teavent.id).version == 3
+
+
+async def test_finalized_teavent_comes_back_after_restart(
+    consumer: UpdatesConsumer, handler: Handler, teavent: Teavent
+):
+    finalized = _version(teavent, 5, state="finalized")
+    await consumer(FakeMessage(TeaventUpdate.full(finalized.snapshot(), 1)))
+    await consumer(FakeMessage(TeaventUpdate.full(_version(teavent, 4).snapshot(), 1)))
+    await _settle(consumer, handler)
+    assert consumer._replica.peek(teavent.id) is None
+
+    await consumer(FakeMessage(TeaventUpdate.full(_version(teavent, 4).snapshot(), 2)))
+    await _settle(consumer, handler)
+
+    assert consumer._replica.peek(teavent.id).version == 4
@@ -0,0 +1,61 @@
+from types import SimpleNamespace
+
+from telegrambridge.filters import AdminsCache
+
+
+class FakeStamps:
+    """Mongo collection of per-chat stamps shared by workers"""
+
+    def __init__(self):
+        self.documents = {}
+        self.reads = 0
+
+    async def find_one(self, filter):
+        self.reads += 1
+        return self.documents.get(filter["_id"])
+
+    async def update_one(self, filter, update, upsert):
+        document = self.documents.setdefault(filter["_id"], {"stamp": 0})
+        document["stamp"] += update["$inc"]["stamp"]
+
+
+class FakeBot:
+    def __init__(self, admin_ids: list[int]):
+        self.admin_ids = admin_ids
+        self.calls = 0
+
+    async def get_chat_administrators(self, chat_id: int):
+        self.calls += 1
+        return [SimpleNamespace(user=SimpleNamespace(id=id)) for id in self.admin_ids]
+
+
+async def test_invalidation_is_shared_by_workers():
+    stamps = FakeStamps()
+    worker1 = AdminsCache(stamps=stamps, stamp_ttl=0)
+    worker2 = AdminsCache(stamps=stamps, stamp_ttl=0)
+    bot = FakeBot([1, 2])
+
+    assert await worker1.get(bot, 42) == {1, 2}
+    assert await worker2.get(bot, 42) == {1, 2}
+    assert await worker2.get(bot, 42) == {1, 2}
+    assert bot.calls == 2
+
+    # demoted, the update is received by the first worker only
+    bot.admin_ids = [1]
+    await worker1.invalidate(42)
+
+    assert await worker2.get(bot, 42) == {1}
+    assert await worker1.get(bot, 42) == {1}
+    assert bot.calls == 4
+
+
+async def test_fresh_stamp_is_not_read_again():
+    stamps = FakeStamps()
+    worker = AdminsCache(stamps=stamps, stamp_ttl=60)
+    bot = FakeBot([1, 2])
+
+    for _ in range(5):
+        assert await worker.get(bot, 42) == {1, 2}
+
+    assert stamps.reads == 1
+    assert bot.calls == 1
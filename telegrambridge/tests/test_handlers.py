@@ -0,0 +1,59 @@
+from aiogram.filters.command import CommandObject
+from aiogram.types import Chat
+import pytest
+
+from common.executors import TasksPage
+from common.models import Teavent, TeaventsPage
+from telegrambridge.handlers import TASKS_USAGE, handle_command_teavents, handle_tasks
+
+
+class FakeMessage:
+    def __init__(self):
+        self.replies: list[dict] = []
+
+    async def reply(self, **kwargs):
+        self.replies.append(kwargs)
+
+
+@pytest.mark.parametrize("args", ["foo bar", "foo -1", "foo 1 2"])
+async def test_tasks_with_bad_offset_replies_usage(args: str):
+    async def tasks(**kwargs):
+        raise AssertionError("must not be queried")
+
+    message = FakeMessage()
+    await handle_tasks(message, CommandObject(command="tasks", args=args), tasks)
+
+    assert message.replies == [{"text": TASKS_USAGE}]
+
+
+async def test_tasks_offset_is_passed():
+    queries = []
+
+    async def tasks(**kwargs):
+        queries.append(kwargs)
+        return TasksPage(total=0, offset=kwargs["offset"], tasks=[])
+
+    message = FakeMessage()
+    await handle_tasks(message, CommandObject(command="tasks", args="remind 40"), tasks)
+
+    assert queries == [{"group_prefix": "remind", "offset": 40}]
+    assert len(message.replies) == 1
+
+
+async def test_teavents_show_the_next_page(teavent: Teavent):
+    queries = []
+
+    async def query_teavents(**kwargs):
+        queries.append(kwargs)
+        return TeaventsPage(teavents=[teavent], next_cursor="1722445200.0|t1")
+
+    message = FakeMessage()
+    message.chat = Chat(id=-100123, type="supergroup")
+    await handle_command_teavents(
+        message,
+        CommandObject(command="teavents", args="1722358800.0|t0"),
+        query_teavents,
+    )
+
+    assert queries == [{"chat_id": "-100123", "cursor": "1722358800.0|t0"}]
+    assert "/teavents 1722445200.0|t1" in message.replies[0]["text"]
@@ -0,0 +1,88 @@
+import asyncio
+
+import pytest
+
+from common.models import Teavent
+from common.rpc import ErrorCode, ErrorInfo, GetTeavent, Reply, UserAction
+from telegrambridge.middlewares import RequestCache
+
+
+class FakeEventManager:
+    """Counts fetches, user actions bump the teavent version"""
+
+    def __init__(self, teavent: Teavent):
+        self.teavent = teavent
+        self.fetches = 0
+
+    async def get_teavent(self, id: str) -> Teavent:
+        self.fetches += 1
+        await asyncio.sleep(0)
+        return self.teavent
+
+    async def user_action(self, teavent_id: str, **kwargs) -> Teavent:
+        return self._bump()
+
+    async def batch(self, requests) -> list[Reply]:
+        return [
+            (
+                Reply(result=self._bump())
+                if isinstance(request, UserAction) and request.user_id != "@nobody"
+                else Reply(error=ErrorInfo(ErrorCode.REJECTED, "not confirmed"))
+            )
+            for request in requests
+        ]
+
+    def _bump(self) -> Teavent:
+        self.teavent = self.teavent.model_copy(
+            update={"version": self.teavent.version + 1}
+        )
+        return self.teavent
+
+
+@pytest.fixture
+def eventmanager(teavent: Teavent) -> FakeEventManager:
+    return FakeEventManager(teavent)
+
+
+@pytest.fixture
+def cache(eventmanager: FakeEventManager) -> RequestCache:
+    return RequestCache(
+        eventmanager.get_teavent, eventmanager.user_action, eventmanager.batch
+    )
+
+
+def _action(teavent: Teavent, user_id: str = "@alice") -> UserAction:
+    return UserAction(type="confirm", user_id=user_id, teavent_id=teavent.id)
+
+
+async def test_reads_of_an_update_share_a_fetch(
+    cache: RequestCache, eventmanager: FakeEventManager, teavent: Teavent
+):
+    await asyncio.gather(*(cache.get_teavent(id=teavent.id) for _ in range(3)))
+
+    assert eventmanager.fetches == 1
+
+
+async def test_user_action_replaces_the_cached_teavent(
+    cache: RequestCache, eventmanager: FakeEventManager, teavent: Teavent
+):
+    await cache.get_teavent(id=teavent.id)
+    changed = await cache.user_action(teavent_id=teavent.id, user_id="@alice")
+
+    assert await cache.get_teavent(id=teavent.id) == changed
+    assert changed.version == teavent.version + 1
+    assert eventmanager.fetches == 1
+
+
+async def test_batch_replaces_or_drops_cached_teavents(
+    cache: RequestCache, eventmanager: FakeEventManager, teavent: Teavent
+):
+    await cache.get_teavent(id=teavent.id)
+    [reply] = await cache.batch([_action(teavent)])
+    assert await cache.get_teavent(id=teavent.id) == reply.result
+
+    # a failed action still drops the teavent, it is fetched again
+    await cache.batch([GetTeavent(id=teavent.id), _action(teavent, "@nobody")])
+    await cache.get_teavent(id=teavent.id)
+
+    assert eventmanager.fetches == 2
@@ -0,0 +1,114 @@
+import asyncio
+
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import (
+    AnswerCallbackQuery,
+    DeleteMessage,
+    EditMessageText,
+    SendMessage,
+    TelegramMethod,
+)
+import pytest
+
+from telegrambridge.outbox import TelegramOutbox
+
+
+class FakeAPI:
+    """`make_request` recording the order calls reach Telegram"""
+
+    def __init__(self):
+        self.calls: list[TelegramMethod] = []
+        self.retry_after: dict[int | str, float] = {}
+
+    async def __call__(self, bot, method: TelegramMethod):
+        chat_id = getattr(method, "chat_id", None)
+        retry_after = self.retry_after.pop(chat_id, None)
+        if retry_after is not None:
+            raise TelegramRetryAfter(method, "Too Many Requests", retry_after)
+
+        self.calls.append(method)
+        return True
+
+
+@pytest.fixture
+def api() -> FakeAPI:
+    return FakeAPI()
+
+
+def _exhaust_global_bucket(outbox: TelegramOutbox):
+    # following calls queue up and are granted one by one
+    outbox._global_bucket.tokens = 0
+    outbox._global_bucket.updated = asyncio.get_running_loop().time()
+
+
+async def test_lanes_are_served_by_priority(api: FakeAPI):
+    outbox = TelegramOutbox(global_rate=200)
+    _exhaust_global_bucket(outbox)
+
+    methods = [
+        DeleteMessage(chat_id=1, message_id=1),
+        SendMessage(chat_id=2, text="new"),
+        EditMessageText(chat_id=3, message_id=1, text="poll"),
+        AnswerCallbackQuery(callback_query_id="1"),
+    ]
+    await asyncio.gather(*(outbox(api, None, m) for m in methods))
+
+    assert [type(m) for m in api.calls] == [
+        AnswerCallbackQuery,
+        EditMessageText,
+        SendMessage,
+        DeleteMessage,
+    ]
+    assert outbox.queue_depth() == {
+        "CALLBACK": 0,
+        "LIVE_EDIT": 0,
+        "SEND": 0,
+        "CLEANUP": 0,
+    }
+
+
+async def test_busy_chat_does_not_block_others(api: FakeAPI):
+    outbox = TelegramOutbox(chat_rate=20, chat_burst=3)
+
+    await asyncio.gather(
+        *(outbox(api, None, SendMessage(chat_id=1, text=str(i))) for i in range(4)),
+        outbox(api, None, SendMessage(chat_id=2, text="other")),
+    )
+
+    # the burst of chat 1 is spent, the other chat goes first
+    assert [m.chat_id for m in api.calls] == [1, 1, 1, 2, 1]
+
+
+async def test_retry_after_blocks_the_chat(api: FakeAPI):
+    outbox = TelegramOutbox()
+    api.retry_after[1] = 0.05
+
+    started = asyncio.get_running_loop().time()
+    await asyncio.gather(
+        outbox(api, None, SendMessage(chat_id=1, text="flood")),
+        outbox(api, None, SendMessage(chat_id=2, text="other")),
+    )
+
+    assert [m.chat_id for m in api.calls] == [2, 1]
+    assert asyncio.get_running_loop().time() - started >= 0.05
+    assert outbox.stats.retries == 1
+
+
+async def test_retry_after_gives_up(api: FakeAPI):
+    outbox = TelegramOutbox(max_retries=0)
+    api.retry_after[1] = 0.01
+
+    with pytest.raises(TelegramRetryAfter):
+        await outbox(api, None, SendMessage(chat_id=1, text="flood"))
+
+
+async def test_chat_ids_of_any_type_share_a_bucket(api: FakeAPI):
+    outbox = TelegramOutbox(chat_rate=20, chat_burst=1)
+
+    await asyncio.gather(
+        outbox(api, None, SendMessage(chat_id=1, text="handler")),
+        outbox(api, None, SendMessage(chat_id="1", text="presenter")),
+        outbox(api, None, SendMessage(chat_id=2, text="other")),
+    )
+
+    assert [m.text for m in api.calls] == ["handler", "other", "presenter"]
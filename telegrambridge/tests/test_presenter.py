@@ -0,0 +1,211 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from common.models import Teavent
+from telegrambridge.views import TeaventPresenter, _message_key
+
+
+class FakeBot:
+    """Records Telegram calls, sending to chats in `down` fails"""
+
+    def __init__(self):
+        self.calls: list[tuple[str, str]] = []
+        self.down: set[str] = set()
+        self._message_id = 0
+
+    async def send_message(self, chat_id: str, **kwargs):
+        self._call("send", chat_id)
+        self._message_id += 1
+        return SimpleNamespace(message_id=self._message_id)
+
+    async def edit_message_text(self, chat_id: str, message_id: str, **kwargs):
+        self._call("edit_text", chat_id)
+
+    async def edit_message_reply_markup(self, chat_id: str, message_id: str, **kwargs):
+        self._call("edit_markup", chat_id)
+
+    async def pin_chat_message(self, chat_id: str, message_id: str):
+        self._call("pin", chat_id)
+
+    def _call(self, name: str, chat_id: str):
+        if chat_id in self.down:
+            raise RuntimeError(f"chat {chat_id} is unavailable")
+        self.calls.append((name, chat_id))
+
+
+class FakeViews:
+    """`teavent_to_views` collection of a fake MongoDB client"""
+
+    def __init__(self):
+        self.documents: dict[str, dict] = {}
+
+    def get_database(self, name: str):
+        return self
+
+    def get_collection(self, name: str):
+        return self
+
+    async def find_one(self, filter: dict) -> dict | None:
+        return self.documents.get(filter["_id"])
+
+    async def insert_one(self, document: dict):
+        self.documents[document["_id"]] = _stored(document)
+
+    async def update_one(self, filter: dict, update: dict):
+        document = self.documents[filter["_id"]]
+        for path, value in update["$set"].items():
+            *parents, name = path.split(".")
+            target = document
+            for parent in parents:
+                target = target[parent]
+            target[name] = _stored(value)
+
+
+def _stored(value):
+    # as MongoDB keeps it: a copy, tuples become lists
+    return json.loads(json.dumps(value))
+
+
+class RecordingPresenter(TeaventPresenter):
+    """Records shown versions instead of talking to Telegram and MongoDB"""
+
+    def __init__(self, **kwargs):
+        super().__init__(None, None, "test", **kwargs)
+        self.shown: list[int] = []
+        self.fail = False
+
+    async def _handle_update(self, teavent: Teavent):
+        if self.fail:
+            raise RuntimeError("telegram is down")
+        self.shown.append(teavent.version)
+
+
+def _version(teavent: Teavent, version: int) -> Teavent:
+    return teavent.model_copy(update={"version": version})
+
+
+@pytest.fixture
+def presenter(teavent: Teavent) -> RecordingPresenter:
+    presenter = RecordingPresenter(edit_debounce=0.01)
+    presenter._shown_states[teavent.id] = teavent.state  # messages are shown
+    return presenter
+
+
+@pytest.mark.parametrize("teavent", [{"state": "poll_open"}], indirect=True)
+async def test_live_edits_are_coalesced(
+    presenter: RecordingPresenter, teavent: Teavent
+):
+    await asyncio.gather(
+        *(presenter.handle_update(_version(teavent, v)) for v in (1, 2, 3))
+    )
+
+    assert presenter.shown == [3]
+    assert not presenter._pending_edits
+
+
+@pytest.mark.parametrize("teavent", [{"state": "poll_open"}], indirect=True)
+async def test_cancelled_edit_does_not_hold_later_ones(
+    presenter: RecordingPresenter, teavent: Teavent
+):
+    first = asyncio.create_task(presenter.handle_update(_version(teavent, 1)))
+    await asyncio.sleep(0)
+    merged = asyncio.create_task(presenter.handle_update(_version(teavent, 2)))
+    await asyncio.sleep(0)
+
+    first.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await first
+    with pytest.raises(RuntimeError):
+        await merged
+
+    await presenter.handle_update(_version(teavent, 3))
+    assert presenter.shown == [3]
+
+
+@pytest.mark.parametrize("teavent", [{"state": "poll_open"}], indirect=True)
+async def test_failed_edit_fails_merged_updates(
+    presenter: RecordingPresenter, teavent: Teavent
+):
+    presenter.fail = True
+
+    results = await asyncio.gather(
+        presenter.handle_update(_version(teavent, 1)),
+        presenter.handle_update(_version(teavent, 2)),
+        return_exceptions=True,
+    )
+
+    assert [str(r) for r in results] == ["telegram is down"] * 2
+
+
+@pytest.fixture
+def bot() -> FakeBot:
+    return FakeBot()
+
+
+@pytest.fixture
+def views() -> FakeViews:
+    return FakeViews()
+
+
+@pytest.fixture
+def shown(teavent: Teavent) -> Teavent:
+    return teavent.model_copy(
+        update={"state": "poll_open", "communication_ids": ["-1", "-2"]}, deep=True
+    )
+
+
+@pytest.fixture
+async def live(bot: FakeBot, views: FakeViews, shown: Teavent) -> TeaventPresenter:
+    presenter = TeaventPresenter(bot, views, "test")
+    await presenter._handle_update(shown)
+    bot.calls.clear()
+    return presenter
+
+
+async def test_unchanged_messages_are_not_edited(
+    live: TeaventPresenter, bot: FakeBot, shown: Teavent
+):
+    await live._handle_update(shown)
+
+    assert bot.calls == []
+
+
+async def test_changed_messages_are_edited_once(
+    live: TeaventPresenter, bot: FakeBot, views: FakeViews, shown: Teavent
+):
+    shown.participant_ids.append("@alice")
+
+    await live._handle_update(shown)
+    await live._handle_update(shown)
+
+    assert bot.calls == [("edit_text", "-1"), ("edit_text", "-2")]
+    fingerprints = views.documents[shown.id]["fingerprints"]
+    assert fingerprints[_message_key("-1", 1)] == fingerprints[_message_key("-2", 2)]
+
+
+async def test_only_markup_is_edited_when_text_is_the_same(
+    live: TeaventPresenter, bot: FakeBot, views: FakeViews, shown: Teavent
+):
+    # as if the keyboard of the first chat was shown by an older release
+    fingerprint = views.documents[shown.id]["fingerprints"][_message_key("-1", 1)]
+    fingerprint[1] = "old keyboard"
+
+    await live._handle_update(shown)
+
+    assert bot.calls == [("edit_markup", "-1")]
+
+
+async def test_failed_chats_are_left_out_of_shown_messages(
+    bot: FakeBot, views: FakeViews, shown: Teavent
+):
+    bot.down.add("-2")
+
+    await TeaventPresenter(bot, views, "test")._handle_update(shown)
+
+    document = views.documents[shown.id]
+    assert document["chat_message_ids"] == [["-1", "1"]]
+    assert list(document["fingerprints"]) == [_message_key("-1", 1)]
+    assert bot.calls == [("send", "-1"), ("pin", "-1")]
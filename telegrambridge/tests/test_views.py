@@ -0,0 +1,12 @@
+from datetime import timezone
+
+from common.models import Teavent
+from telegrambridge.views import _when, _when_inline
+
+
+def test_cached_times_are_local_to_zone(teavent: Teavent):
+    utc_start = teavent.start.astimezone(timezone.utc)
+
+    assert _when_inline(teavent.start) == "31 июля, в 21:00"
+    assert _when_inline(utc_start) == "31 июля, в 17:00"
+    assert _when(teavent.start) != _when(utc_start)
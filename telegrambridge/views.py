@@ -1,7 +1,10 @@
 from abc import ABC, abstractmethod
 import asyncio
-from contextlib import suppress
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, tzinfo
+from functools import lru_cache
+import hashlib
+import json
+import logging
 from urllib.parse import quote_plus
 
 import aiogram
@@ -9,6 +12,7 @@ import humanize
 from babel.dates import format_datetime
 import motor.motor_asyncio as aio_mongo
 from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import InlineKeyboardMarkup
 from aiogram.utils.formatting import (
     as_list,
     as_section,
@@ -19,20 +23,27 @@ from aiogram.utils.formatting import (
     Text,
     Underline,
     Italic,
+    Code,
 )
-from attr import define
+from attr import define, field
 
+from common.executors import TasksPage
 from common.flow import TeaventFlow
 from common.models import Teavent
+from telegrambridge.concurrency import KeyedLock, fan_out
 from telegrambridge.keyboards import (
     make_plannedpoll_keyboard,
     make_regpoll_keyboard,
     make_started_keyboard,
 )
 
+log = logging.getLogger(__name__)
+
 humanize.i18n.activate("ru")
 
 
+# formatted pieces are cached: the same teavent is re-rendered on every click
+@lru_cache(maxsize=1024)
 def _location(location: str) -> Text:
     base_url = "https://www.google.com/maps/search/"
     return as_key_value(
@@ -45,10 +56,23 @@ def _location(location: str) -> Text:
 
 
 def _when_inline(dt: datetime) -> str:
+    return _when_inline_in(dt, dt.tzinfo)
+
+
+# datetimes of the same instant in different zones are equal, but are shown as
+# different local times: the zone is a part of the cache key
+@lru_cache(maxsize=1024)
+def _when_inline_in(dt: datetime, tz: tzinfo | None) -> str:
     return format_datetime(dt, "d MMMM, в HH:mm", locale="ru")
 
 
 def _when(dt: datetime) -> Text:
+    return _when_in(dt, dt.tzinfo)
+
+
+# keyed by zone as `_when_inline_in`
+@lru_cache(maxsize=1024)
+def _when_in(dt: datetime, tz: tzinfo | None) -> Text:
     return as_key_value(
         "🕐 Начало",
         Text(
@@ -59,6 +83,7 @@ def _when(dt: datetime) -> Text:
     )
 
 
+@lru_cache(maxsize=256)
 def _duration(td: timedelta) -> Text:
     return as_key_value(
         "⏳️ Продолжительность", humanize.precisedelta(td, format="%0.0f")
@@ -96,6 +121,13 @@ def _settings(teavent_id: str) -> Text:
     return Text("⚙️", f"/settings_{teavent_id}")
 
 
+@define(frozen=True)
+class Rendered:
+    text_kwargs: dict
+    markup: InlineKeyboardMarkup | None
+    fingerprint: list[str]
+
+
 @define
 class TeaventView(ABC):
     @abstractmethod
@@ -104,6 +136,12 @@ class TeaventView(ABC):
     @abstractmethod
     def keyboard(self, t: Teavent): ...
 
+    def render(self, t: Teavent) -> Rendered:
+        """Final message content, rendered once and sent to every chat"""
+        text_kwargs = self.text(t).as_kwargs()
+        markup = self.keyboard(t)
+        return Rendered(text_kwargs, markup, _fingerprint(text_kwargs, markup))
+
 
 class RegPollView(TeaventView):
     def text(self, t: Teavent) -> Text:
@@ -200,6 +238,13 @@ class CancelledView(TeaventView):
         return None
 
 
+@define(eq=False)
+class _PendingEdit:
+    teavent: Teavent
+    seq: int
+    done: asyncio.Future  # result is the error of the edit or None
+
+
 @define
 class TeaventPresenter:
     _bot: aiogram.Bot
@@ -207,8 +252,21 @@ class TeaventPresenter:
     _client: aio_mongo.AsyncIOMotorClient
     _db_name: str
 
+    _max_concurrent_updates: int = 16
+    _fan_out_limit: int = 8  # concurrent Telegram calls per update
+    _edit_debounce: float = 0.5
+
+    # updates of the same teavent are applied in order, different ones concurrently
     # TODO try to replace with MongoDB transaction
-    _update_lock = asyncio.Lock()
+    _update_locks: KeyedLock = field(factory=KeyedLock)
+    _updates_semaphore: asyncio.Semaphore = field()
+
+    # per teavent: state of rendered messages, pending debounced edit,
+    # sequence numbers of received and applied updates
+    _shown_states: dict[str, str] = field(factory=dict)
+    _pending_edits: dict[str, _PendingEdit] = field(factory=dict)
+    _received: dict[str, int] = field(factory=dict)
+    _applied: dict[str, int] = field(factory=dict)
 
     _state_to_view = {
         TeaventFlow.poll_open.value: RegPollView(),
@@ -217,24 +275,86 @@ class TeaventPresenter:
         TeaventFlow.cancelled.value: CancelledView(),
     }
 
+    @_updates_semaphore.default
+    def _make_updates_semaphore(self):
+        return asyncio.Semaphore(self._max_concurrent_updates)
+
     async def handle_update(self, teavent: Teavent):
-        async with self._update_lock:
-            await self._handle_update(teavent, lock=self._update_lock)
+        seq = self._received[teavent.id] = self._received.get(teavent.id, 0) + 1
+
+        if self._shown_states.get(teavent.id) != teavent.state:
+            # state change must be shown right away and supersedes a pending edit
+            self._pending_edits.pop(teavent.id, None)
+            return await self._apply(teavent, seq)
+
+        # live edit of the same messages: keep only the latest within the window
+        if pending := self._pending_edits.get(teavent.id):
+            pending.teavent, pending.seq = teavent, seq
+            if error := await asyncio.shield(pending.done):
+                raise error
+            return
+
+        pending = self._pending_edits[teavent.id] = _PendingEdit(
+            teavent, seq, done=asyncio.get_running_loop().create_future()
+        )
+        error = None
+        try:
+            try:
+                await asyncio.sleep(self._edit_debounce)
+            finally:
+                # a cancelled edit must not collect later ones forever
+                if self._pending_edits.get(teavent.id) is pending:
+                    del self._pending_edits[teavent.id]
+            await self._apply(pending.teavent, pending.seq)
+        except asyncio.CancelledError:
+            error = RuntimeError(f"Edit of teavent {teavent.id} is cancelled")
+            raise
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            # updates merged into this edit fail with it
+            pending.done.set_result(error)
+
+    async def _apply(self, teavent: Teavent, seq: int):
+        async with self._update_locks.acquire(teavent.id), self._updates_semaphore:
+            if seq < self._applied.get(teavent.id, 0):
+                return  # newer update is already shown
+
+            self._applied[teavent.id] = seq
+            await self._handle_update(teavent)
+
+            if teavent.state == TeaventFlow.finalized.value:
+                for d in (self._shown_states, self._received, self._applied):
+                    d.pop(teavent.id, None)
+            else:
+                self._shown_states[teavent.id] = teavent.state
 
-    async def _handle_update(self, teavent: Teavent, lock: asyncio.Lock):
+    async def _handle_update(self, teavent: Teavent):
         t2v = self._client.get_database(self._db_name).get_collection(
             "teavent_to_views"
         )
 
         if data := await t2v.find_one({"_id": teavent.id}):
             if data["state"] == teavent.state:
-                await self._update(data["chat_message_ids"], teavent)
+                changed = await self._update(
+                    data["chat_message_ids"], teavent, data.get("fingerprints", {})
+                )
+                if changed:
+                    await t2v.update_one(
+                        filter={"_id": teavent.id},
+                        update={
+                            "$set": {
+                                f"fingerprints.{key}": fingerprint
+                                for key, fingerprint in changed.items()
+                            }
+                        },
+                    )
             else:
                 await self._unpin(data["chat_message_ids"])
-                with suppress(TelegramBadRequest):
-                    await self._clear_markup(data["chat_message_ids"])
+                await self._clear_markup(data["chat_message_ids"])
 
-                chat_message_ids = await self._show(teavent)
+                chat_message_ids, fingerprints = await self._show(teavent)
                 await self._pin(chat_message_ids)
                 await t2v.update_one(
                     filter={"_id": teavent.id},
@@ -242,67 +362,145 @@ class TeaventPresenter:
                         "$set": {
                             "state": teavent.state,
                             "chat_message_ids": chat_message_ids,
+                            "fingerprints": fingerprints,
                         }
                     },
                 )
 
         else:
-            chat_message_ids = await self._show(teavent)
+            chat_message_ids, fingerprints = await self._show(teavent)
             await self._pin(chat_message_ids)
             await t2v.insert_one(
                 {
                     "_id": teavent.id,
                     "state": teavent.state,
                     "chat_message_ids": chat_message_ids,
+                    "fingerprints": fingerprints,
                 },
             )
 
     async def _show(self, teavent: Teavent):
         chat_message_ids = []
+        fingerprints = {}
 
         if view := self._get_view(teavent.state):
-            for chat_id in teavent.communication_ids:
-                message = await self._bot.send_message(
+            rendered = view.render(teavent)
+
+            async def send(chat_id: str):
+                return await self._bot.send_message(
                     chat_id=chat_id,
                     disable_web_page_preview=True,
                     # the order of following parameters MATTERS
-                    reply_markup=view.keyboard(teavent),
-                    **view.text(teavent).as_kwargs(),
+                    reply_markup=rendered.markup,
+                    **rendered.text_kwargs,
                 )
+
+            chat_ids = teavent.communication_ids
+            messages = await self._fan_out("send", send, chat_ids)
+
+            # collected once every chat is done, failed chats are skipped
+            for chat_id, message in zip(chat_ids, messages):
+                if isinstance(message, Exception):
+                    continue
                 chat_message_ids.append((chat_id, str(message.message_id)))
+                key = _message_key(chat_id, message.message_id)
+                fingerprints[key] = rendered.fingerprint
+
+        return chat_message_ids, fingerprints
 
-        return chat_message_ids
+    async def _update(
+        self, chat_message_ids: list, teavent: Teavent, fingerprints: dict
+    ) -> dict[str, list[str]]:
+        """Edits only messages whose rendered content changed, returns new fingerprints"""
+        changed = {}
 
-    async def _update(self, chat_message_ids: list, teavent: Teavent):
         if view := self._get_view(teavent.state):
-            for chat_id, message_id in chat_message_ids:
-                with suppress(TelegramBadRequest):
-                    await self._bot.edit_message_text(
-                        chat_id=chat_id,
-                        message_id=message_id,
-                        disable_web_page_preview=True,
-                        reply_markup=view.keyboard(teavent),
-                        **view.text(teavent).as_kwargs(),
-                    )
+            rendered = view.render(teavent)
+
+            async def edit(chat_message_id: tuple[str, str]):
+                chat_id, message_id = chat_message_id
+                key = _message_key(chat_id, message_id)
+                shown = fingerprints.get(key)
+                if shown == rendered.fingerprint:
+                    return
+
+                try:
+                    if shown is not None and shown[0] == rendered.fingerprint[0]:
+                        await self._bot.edit_message_reply_markup(
+                            chat_id=chat_id,
+                            message_id=message_id,
+                            reply_markup=rendered.markup,
+                        )
+                    else:
+                        await self._bot.edit_message_text(
+                            chat_id=chat_id,
+                            message_id=message_id,
+                            disable_web_page_preview=True,
+                            reply_markup=rendered.markup,
+                            **rendered.text_kwargs,
+                        )
+                except TelegramBadRequest as e:
+                    if "message is not modified" not in e.message:
+                        raise
+
+                changed[key] = rendered.fingerprint
+
+            await self._fan_out("edit", edit, chat_message_ids)
+
+        return changed
 
     async def _pin(self, chat_message_ids: list):
-        for chat_id, message_id in chat_message_ids:
-            await self._bot.pin_chat_message(chat_id, message_id)
+        async def pin(chat_message_id: tuple[str, str]):
+            await self._bot.pin_chat_message(*chat_message_id)
+
+        await self._fan_out("pin", pin, chat_message_ids)
 
     async def _unpin(self, chat_message_ids: list):
-        for chat_id, message_id in chat_message_ids:
+        async def unpin(chat_message_id: tuple[str, str]):
+            chat_id, message_id = chat_message_id
             await self._bot.unpin_chat_message(chat_id=chat_id, message_id=message_id)
 
+        await self._fan_out("unpin", unpin, chat_message_ids)
+
     async def _clear_markup(self, chat_message_ids: list):
-        for chat_id, message_id in chat_message_ids:
+        async def clear_markup(chat_message_id: tuple[str, str]):
+            chat_id, message_id = chat_message_id
             await self._bot.edit_message_reply_markup(
                 chat_id=chat_id, message_id=message_id, reply_markup=None
             )
 
+        await self._fan_out("clear markup", clear_markup, chat_message_ids)
+
+    async def _fan_out(self, op: str, fn, items: list) -> list:
+        results = await fan_out(fn, items, limit=self._fan_out_limit)
+
+        for item, result in zip(items, results):
+            if isinstance(result, Exception):
+                log.warning(f"Failed to {op} {item}: {result!r}")
+
+        return results
+
     def _get_view(self, state: str) -> TeaventView | None:
         return self._state_to_view.get(state)
 
 
+def _message_key(chat_id: str, message_id: str | int) -> str:
+    return f"{chat_id}:{message_id}"
+
+
+def _fingerprint(text_kwargs: dict, markup) -> list[str]:
+    """Hashes of rendered text and keyboard to skip no-op edits"""
+    entities = [e.model_dump(mode="json") for e in text_kwargs.get("entities") or []]
+    text = json.dumps([text_kwargs["text"], entities], ensure_ascii=False)
+    markup_json = markup.model_dump_json() if markup is not None else ""
+
+    return [_digest(text), _digest(markup_json)]
+
+
+def _digest(data: str) -> str:
+    return hashlib.blake2b(data.encode(), digest_size=8).hexdigest()
+
+
 def render_teavent(t: Teavent, with_settings: bool = True) -> Text:
     return as_section(
         TextLink(t.summary, url=t.link),
@@ -317,8 +515,10 @@ def render_teavent(t: Teavent, with_settings: bool = True) -> Text:
     )
 
 
-def render_teavents(teavents: list[Teavent]) -> Text:
+def render_teavents(teavents: list[Teavent], next_cursor: str | None = None) -> Text:
     teavents_list = [render_teavent(t) for t in teavents] or ["~"]
+    if next_cursor is not None:
+        teavents_list.append(Text("Ещё: ", Code(f"/teavents {next_cursor}")))
 
     return as_section(
         Bold(Underline("БЛИЖАЙШИЕ СОБЫТИЯ")),
@@ -328,3 +528,19 @@ def render_teavents(teavents: list[Teavent]) -> Text:
             sep="\n\n",
         ),
     )
+
+
+def render_tasks(page: TasksPage) -> Text:
+    shown = f"{page.offset + 1}-{page.offset + len(page.tasks)}" if page.tasks else "0"
+    tasks_list = [
+        as_key_value(
+            Code(t.get_name()), t.due.isoformat(timespec="seconds") if t.due else "~"
+        )
+        for t in page.tasks
+    ] or ["~"]
+
+    return as_section(
+        Bold(Underline(f"ЗАДАЧИ {shown} ИЗ {page.total}")),
+        "\n",
+        as_list(*tasks_list),
+    )